@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from api.search import SEARCH_TABLES, SEARCH_COLUMNS
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -90,9 +92,19 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text search index lives outside the models, keep autogenerate from dropping it
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and reflected and compare_to is None:
+            return not any(name.startswith(table) for table in SEARCH_TABLES)
+        if type_ == 'column' and reflected and compare_to is None:
+            return name not in SEARCH_COLUMNS
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
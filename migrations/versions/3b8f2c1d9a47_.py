@@ -0,0 +1,25 @@
+"""index open task feed
+
+Revision ID: 3b8f2c1d9a47
+Revises: 1e68ca995137
+Create Date: 2024-07-02 10:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f2c1d9a47'
+down_revision = '1e68ca995137'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keyset pagination of GET /api/tasks seeks on (status, id)
+    op.create_index('ix_task_status_id', 'task', ['status', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_task_status_id', table_name='task')
@@ -0,0 +1,56 @@
+"""read receipt watermarks per chat and user
+
+Revision ID: 4d8e2b7c9a15
+Revises: e2a7b8c4d915
+Create Date: 2024-07-17 10:12:44.581203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8e2b7c9a15'
+down_revision = 'e2a7b8c4d915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_read_receipt',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_seen_message_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'user_id')
+    )
+    # each reader has seen up to the newest message the other participant sent them that is flagged seen
+    op.execute(
+        "INSERT INTO chat_read_receipt (chat_id, user_id, last_seen_message_id) "
+        "SELECT chat_message.chat_id, CASE WHEN chat_message.sender_user_id = chat.requester_user_id "
+        "THEN chat.seeker_user_id ELSE chat.requester_user_id END AS reader_id, MAX(chat_message.id) "
+        "FROM chat_message JOIN chat ON chat.id = chat_message.chat_id "
+        "WHERE chat_message.seen GROUP BY chat_message.chat_id, reader_id"
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_chat_message_chat_id_id', 'chat_message', ['chat_id', 'id'], unique=False, postgresql_concurrently=True)
+            op.drop_index('ix_chat_message_chat_id_unseen', table_name='chat_message', postgresql_concurrently=True)
+    else:
+        op.create_index('ix_chat_message_chat_id_id', 'chat_message', ['chat_id', 'id'], unique=False)
+        op.drop_index('ix_chat_message_chat_id_unseen', table_name='chat_message')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_chat_message_chat_id_unseen', 'chat_message', ['chat_id', 'sender_user_id'], unique=False,
+                            postgresql_concurrently=True, postgresql_where=sa.text('seen = false'))
+            op.drop_index('ix_chat_message_chat_id_id', table_name='chat_message', postgresql_concurrently=True)
+    else:
+        op.create_index('ix_chat_message_chat_id_unseen', 'chat_message', ['chat_id', 'sender_user_id'], unique=False, sqlite_where=sa.text('seen = 0'))
+        op.drop_index('ix_chat_message_chat_id_id', table_name='chat_message')
+
+    op.drop_table('chat_read_receipt')
@@ -0,0 +1,44 @@
+"""geohash index on address
+
+Revision ID: 7c41e0b5d2f8
+Revises: 3b8f2c1d9a47
+Create Date: 2024-07-04 17:45:03.502911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from api.utils import geohash_encode
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e0b5d2f8'
+down_revision = '3b8f2c1d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('address', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index(batch_op.f('ix_address_geohash'), ['geohash'], unique=False)
+
+    connection = op.get_bind()
+    addresses = connection.execute(sa.text('SELECT id, latitude, longitude FROM address')).fetchall()
+    if addresses:
+        connection.execute(
+            sa.text('UPDATE address SET geohash = :geohash WHERE id = :id'),
+            [{'id': id, 'geohash': geohash_encode(latitude, longitude)} for id, latitude, longitude in addresses]
+        )
+
+    op.create_index(op.f('ix_task_pickup_location_id'), 'task', ['pickup_location_id'], unique=False)
+    op.create_index(op.f('ix_task_delivery_location_id'), 'task', ['delivery_location_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_task_delivery_location_id'), table_name='task')
+    op.drop_index(op.f('ix_task_pickup_location_id'), table_name='task')
+
+    with op.batch_alter_table('address', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_address_geohash'))
+        batch_op.drop_column('geohash')
@@ -0,0 +1,39 @@
+"""full-text search index on task
+
+Revision ID: 9a2d6e4f1c03
+Revises: 7c41e0b5d2f8
+Create Date: 2024-07-08 11:20:57.340116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a2d6e4f1c03'
+down_revision = '7c41e0b5d2f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("ALTER TABLE task ADD COLUMN search_vector tsvector")
+        op.execute(
+            "UPDATE task SET search_vector = setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+        )
+        op.execute("CREATE INDEX ix_task_search_vector ON task USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE task_fts USING fts5(title, description)")
+        op.execute("INSERT INTO task_fts (rowid, title, description) SELECT id, title, description FROM task")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX ix_task_search_vector")
+        op.execute("ALTER TABLE task DROP COLUMN search_vector")
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE task_fts")
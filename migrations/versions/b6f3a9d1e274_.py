@@ -0,0 +1,31 @@
+"""unread notification counter on user
+
+Revision ID: b6f3a9d1e274
+Revises: 4d8e2b7c9a15
+Create Date: 2024-07-19 09:31:27.114385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f3a9d1e274'
+down_revision = '4d8e2b7c9a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        'UPDATE "user" SET unread_notifications = '
+        '(SELECT COUNT(*) FROM notification WHERE notification.user_id = "user".id AND notification.seen = false)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')
@@ -0,0 +1,28 @@
+"""version stamps for cached reads
+
+Revision ID: c5e19f7a3b62
+Revises: 9a2d6e4f1c03
+Create Date: 2024-07-11 09:03:26.774530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e19f7a3b62'
+down_revision = '9a2d6e4f1c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('version_stamp',
+    sa.Column('key', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('version_stamp')
@@ -0,0 +1,42 @@
+"""rating sums and star histograms on requester and task_seeker
+
+Revision ID: d81c4f6a2b39
+Revises: b6f3a9d1e274
+Create Date: 2024-07-22 15:04:52.630918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81c4f6a2b39'
+down_revision = 'b6f3a9d1e274'
+branch_labels = None
+depends_on = None
+
+RATED_PROFILES = (('requester', 'requester_id'), ('task_seeker', 'seeker_id'))
+AGGREGATES = ['rating_sum'] + [f'stars_{stars}' for stars in range(1, 6)]
+
+
+def upgrade():
+    for table, column in RATED_PROFILES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for aggregate in AGGREGATES:
+                batch_op.add_column(sa.Column(aggregate, sa.Integer(), server_default='0', nullable=False))
+
+        # recompute everything from the ratings, the stored means could have drifted
+        ratings = f'FROM ratings WHERE ratings.{column} = {table}.user_id'
+        histogram = ', '.join(f'stars_{stars} = (SELECT COUNT(*) {ratings} AND ratings.stars = {stars})' for stars in range(1, 6))
+        op.execute(
+            f'UPDATE {table} SET total_reviews = (SELECT COUNT(*) {ratings}), '
+            f'rating_sum = (SELECT COALESCE(SUM(ratings.stars), 0) {ratings}), '
+            f'overall_rating = (SELECT COALESCE(AVG(CAST(ratings.stars AS FLOAT)), 0) {ratings}), {histogram}'
+        )
+
+
+def downgrade():
+    for table, _ in RATED_PROFILES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for aggregate in reversed(AGGREGATES):
+                batch_op.drop_column(aggregate)
@@ -0,0 +1,59 @@
+"""indexes for hot filters
+
+Revision ID: e2a7b8c4d915
+Revises: c5e19f7a3b62
+Create Date: 2024-07-15 14:31:09.209671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7b8c4d915'
+down_revision = 'c5e19f7a3b62'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index predicate), SQLite only matches predicates written the way queries render them
+INDEXES = [
+    ('ix_task_requester_id_status', 'task', ['requester_id', 'status'], None),
+    ('ix_task_seeker_id_status', 'task', ['seeker_id', 'status'], None),
+    ('ix_postulant_seeker_id_id', 'postulant', ['seeker_id', 'id'], None),
+    ('ix_postulant_task_id', 'postulant', ['task_id'], None),
+    ('ix_chat_message_chat_id_timestamp', 'chat_message', ['chat_id', 'timestamp', 'id'], None),
+    ('ix_chat_message_chat_id_unseen', 'chat_message', ['chat_id', 'sender_user_id'], 'seen = false'),
+    ('ix_notification_user_id_id', 'notification', ['user_id', 'id'], None),
+    ('ix_notification_user_id_unseen', 'notification', ['user_id'], 'seen = false'),
+    ('ix_ratings_requester_id', 'ratings', ['requester_id'], None),
+    ('ix_ratings_seeker_id', 'ratings', ['seeker_id'], None),
+    ('ix_ratings_task_id', 'ratings', ['task_id'], None),
+    ('ix_chat_requester_user_id', 'chat', ['requester_user_id'], None),
+    ('ix_chat_seeker_user_id', 'chat', ['seeker_user_id'], None),
+    ('ix_chat_task_id', 'chat', ['task_id'], None),
+    ('ix_address_user_id', 'address', ['user_id'], None),
+    ('ix_requester_user_id', 'requester', ['user_id'], None),
+    ('ix_task_seeker_user_id', 'task_seeker', ['user_id'], None),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY keeps the tables writable while the indexes build, but cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in INDEXES:
+                op.create_index(name, table, columns, unique=False, postgresql_concurrently=True,
+                                postgresql_where=sa.text(where) if where else None)
+    else:
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, unique=False, sqlite_where=sa.text(where.replace('false', '0')) if where else None)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    else:
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table)
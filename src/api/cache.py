@@ -0,0 +1,140 @@
+"""
+Version stamps and the serialized response cache built on them.
+Every flush that touches a stamped model queues the matching version_stamp keys, which are bumped
+in their own short transaction once the session committed. Readers take the versions before the
+data, so a cached entry keyed by the versions it was built from can never be served after a write,
+from this worker or any other one sharing the database, and no write transaction holds a lock on
+the shared stamp rows.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import db, upsert, VersionStamp, User, Requester, TaskSeeker, Task, Address, Category, Rating, Postulant, Notification, ChatMessage
+
+# everything serialized into the open task feed
+TASKS = 'tasks'
+USERS = 'users'
+
+def notifications_key(user_id):
+    return f'notifications:{user_id}'
+
+def chat_messages_key(chat_id):
+    return f'chat:{chat_id}:messages'
+
+STAMPED_MODELS = {
+    Task: lambda task: [TASKS],
+    Postulant: lambda postulant: [TASKS],
+    Rating: lambda rating: [TASKS],
+    Address: lambda address: [TASKS],
+    Category: lambda category: [TASKS],
+    Requester: lambda requester: [TASKS, USERS],
+    TaskSeeker: lambda seeker: [TASKS, USERS],
+    User: lambda user: [TASKS, USERS],
+    Notification: lambda notification: [notifications_key(notification.user_id)],
+    ChatMessage: lambda message: [chat_messages_key(message.chat_id)],
+}
+
+def bump_versions(connection, keys):
+    keys = sorted(set(keys))
+    if not keys: return
+    statement = upsert(connection, VersionStamp.__table__)
+    statement = statement.on_conflict_do_update(index_elements=['key'], set_={'version': VersionStamp.__table__.c.version + 1})
+    connection.execute(statement, [{'key': key, 'version': 1} for key in keys])
+
+def current_versions(keys):
+    rows = dict(db.session.query(VersionStamp.key, VersionStamp.version).filter(VersionStamp.key.in_(keys)).all())
+    return tuple(rows.get(key, 0) for key in keys)
+
+def bump_after_commit(session, keys):
+    """
+    Queues `keys` to be bumped once `session` commits, for writes that bypass the flush hooks.
+    """
+    session.info.setdefault('stamp_keys', set()).update(keys)
+
+@event.listens_for(Session, 'after_flush')
+def collect_flushed_versions(session, flush_context):
+    keys = []
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        stamp = STAMPED_MODELS.get(type(instance))
+        if stamp: keys += stamp(instance)
+    bump_after_commit(session, keys)
+
+@event.listens_for(Session, 'after_commit')
+def bump_committed_versions(session):
+    keys = session.info.pop('stamp_keys', None)
+    if not keys: return
+    # the session's transaction is over, the stamps get one of their own that commits right away
+    with session.get_bind().begin() as connection:
+        bump_versions(connection, keys)
+
+@event.listens_for(Session, 'after_rollback')
+def drop_rolled_back_versions(session):
+    session.info.pop('stamp_keys', None)
+
+class ResponseCache:
+    """
+    Bounded LRU of encoded JSON bodies keyed by (name, params, versions of the keys they depend on).
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None: self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def response(self, name, params, keys, build):
+        """
+        Returns a cached JSON response for `name`/`params`, calling `build()` for the payload only
+        when one of `keys` has been written since the cached body was encoded.
+        """
+        cache_key = (name, params, current_versions(keys))
+        body = self.get(cache_key)
+        if body is None:
+            body = jsonify(build()).get_data()
+            self.put(cache_key, body)
+        return current_app.response_class(body, mimetype='application/json')
+
+feed_cache = ResponseCache()
+
+def conditional(keys):
+    """
+    Decorator adding a strong ETag derived from the version stamps returned by `keys(**view_args)`.
+    A matching If-None-Match is answered with 304 before the view runs, so nothing is serialized.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            stamp_keys = keys(**kwargs)
+            versions = current_versions(stamp_keys)
+            etag = hashlib.sha1(repr((request.endpoint, sorted(kwargs.items()), request.query_string, stamp_keys, versions)).encode()).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200: response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
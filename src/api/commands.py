@@ -1,12 +1,85 @@
 
+import re
+import sys
+
 import click
-from api.models import db, User
+from sqlalchemy import text, select, update, bindparam, cast, func, or_, Float
+from api.models import db, RoleEnum, User, Task, StatusEnum, CLOSED_STATUSES, Postulant, Rating, Notification, Chat, ChatMessage, Address, Requester, TaskSeeker
+from api.cache import bump_after_commit, TASKS, USERS
+from api.imports import TaskImporter, read_rows, detect_format, FORMATS, IMPORT_BATCH_SIZE
+from api.seeding import Seeder, SEED_BATCH_SIZE
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
 Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration 
 with youy database, for example: Import the price of bitcoin every night as 12am
 """
+def _differs(column, value):
+    if isinstance(column.type, Float):
+        # averages computed incrementally and by SQL may differ in the last bits
+        return or_(column.is_(None), func.abs(column - value) > 1e-9)
+    return column.is_distinct_from(value)
+
+def _reconcile(table, values, chunk_size):
+    """
+    Sets the `table` counters in `values`, correlated subqueries recomputing each one from the rows it summarizes,
+    on every row where one of them drifted. Each chunk of ids is a single UPDATE that reads and writes in the same
+    statement, so an increment committed meanwhile is counted instead of overwritten. Returns (rows checked, rows fixed).
+    """
+    low, high, checked = db.session.connection().execute(select(func.min(table.c.id), func.max(table.c.id), func.count())).one()
+    drifted = or_(*(_differs(table.c[name], value) for name, value in values.items()))
+    statement = update(table).where(table.c.id.between(bindparam('low'), bindparam('high')), drifted).values(values)
+
+    fixed = 0
+    for start in range(low or 0, (high or -1) + 1, chunk_size):
+        changed = db.session.connection().execute(statement, {'low': start, 'high': start + chunk_size - 1}).rowcount
+        if changed: bump_after_commit(db.session, [TASKS, USERS])
+        db.session.commit()
+        fixed += changed
+    return checked, fixed
+
+def _count(table, *conditions):
+    return select(func.count()).select_from(table).where(*conditions).scalar_subquery()
+
+def _rating_counters(column, key):
+    ratings = Rating.__table__
+    counters = {
+        'total_reviews': _count(ratings, column == key),
+        'rating_sum': select(func.coalesce(func.sum(ratings.c.stars), 0)).where(column == key).scalar_subquery(),
+        'overall_rating': select(func.coalesce(func.avg(cast(ratings.c.stars, Float)), 0)).where(column == key).scalar_subquery(),
+    }
+    for stars in range(1, 6):
+        counters[f'stars_{stars}'] = _count(ratings, column == key, ratings.c.stars == stars)
+    return counters
+
+def reconcile_stats(chunk_size=1000):
+    """
+    Recomputes every denormalized counter from the rows it summarizes, one set-based UPDATE per chunk of
+    ids that writes only the drifted rows. Returns {counter table: (rows checked, rows fixed)}.
+    """
+    tasks, ratings, notifications = Task.__table__, Rating.__table__, Notification.__table__
+    requester, seeker, user = Requester.__table__, TaskSeeker.__table__, User.__table__
+    is_open = tasks.c.status.notin_(CLOSED_STATUSES)
+
+    requested = {
+        'total_requested_tasks': _count(tasks, tasks.c.requester_id == requester.c.id),
+        'total_open_tasks': _count(tasks, tasks.c.requester_id == requester.c.id, is_open),
+        'average_budget': select(func.coalesce(func.avg(cast(tasks.c.budget, Float)), 0)).where(tasks.c.requester_id == requester.c.id).scalar_subquery(),
+    }
+    assigned = {
+        'total_completed_tasks': _count(tasks, tasks.c.seeker_id == seeker.c.id, tasks.c.status == StatusEnum.COMPLETED),
+        'total_ongoing_tasks': _count(tasks, tasks.c.seeker_id == seeker.c.id, is_open),
+    }
+    unread = {'unread_notifications': _count(notifications, notifications.c.user_id == user.c.id, notifications.c.seen == False)}
+
+    return {
+        'requester tasks': _reconcile(requester, requested, chunk_size),
+        'requester ratings': _reconcile(requester, _rating_counters(ratings.c.requester_id, requester.c.user_id), chunk_size),
+        'seeker tasks': _reconcile(seeker, assigned, chunk_size),
+        'seeker ratings': _reconcile(seeker, _rating_counters(ratings.c.seeker_id, seeker.c.user_id), chunk_size),
+        'user notifications': _reconcile(user, unread, chunk_size),
+    }
+
 def setup_commands(app):
     
     """ 
@@ -18,17 +91,122 @@ def setup_commands(app):
     @click.argument("count") # argument of out command
     def insert_test_users(count):
         print("Creating test users")
+        users = []
         for x in range(1, int(count) + 1):
             user = User()
+            user.username = "test_user" + str(x)
             user.email = "test_user" + str(x) + "@test.com"
             user.password = "123456"
-            user.is_active = True
-            db.session.add(user)
-            db.session.commit()
-            print("User: ", user.email, " created.")
+            user.role = RoleEnum.NONE
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        for user in users: print("User: ", user.email, " created.")
 
         print("All test users created")
 
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        """
+        Seeds a small development dataset, see `flask seed` for larger ones.
+        """
+        Seeder(progress=print).run(users=50, tasks=200)
+        reconcile_stats()
+        print("Test data created")
+
+    @app.cli.command("seed")
+    @click.option("--users", default=1000, show_default=True, help="Users to create, each with a home address and one or both roles.")
+    @click.option("--tasks", default=5000, show_default=True, help="Tasks to create, with their applicants, ratings, chats and messages.")
+    @click.option("--messages-per-chat", default=8, show_default=True, help="Average messages per chat.")
+    @click.option("--notifications-per-user", default=3, show_default=True, help="Average notifications per user.")
+    @click.option("--seed", "random_seed", default=42, show_default=True, help="Random seed, the same seed reproduces the same data.")
+    @click.option("--batch-size", default=SEED_BATCH_SIZE, show_default=True, help="Rows written per INSERT batch.")
+    def seed(users, tasks, messages_per_chat, notifications_per_user, random_seed, batch_size):
+        """
+        Fills the database with a reproducible synthetic dataset for load testing, run it on an idle database.
+        """
+        counts = Seeder(seed=random_seed, batch_size=batch_size, progress=print).run(users, tasks, messages_per_chat, notifications_per_user)
+        for table, count in counts.items():
+            print(f"{table}: {count} rows")
+        for name, (checked, fixed) in reconcile_stats().items():
+            print(f"{name}: {fixed} of {checked} rows reconciled")
+
+    @app.cli.command("reconcile-stats")
+    @click.option("--chunk-size", default=1000, show_default=True, help="Rows written per UPDATE batch and commit.")
+    def reconcile_stats_command(chunk_size):
+        """
+        Recomputes the task, rating and notification counters of every user, safe to run nightly.
+        """
+        for name, (checked, fixed) in reconcile_stats(chunk_size).items():
+            print(f"{name}: {fixed} of {checked} rows fixed")
+
+    @app.cli.command("import-tasks")
+    @click.argument("source", type=click.File("rb"))
+    @click.option("--format", type=click.Choice(FORMATS), help="Input format, guessed from the file name when omitted.")
+    @click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True, help="Tasks written per INSERT batch and commit.")
+    def import_tasks(source, format, batch_size):
+        """
+        Imports tasks from a CSV or JSON Lines file, or - for standard input.
+        """
+        format = format or detect_format(source.name)
+        if format not in FORMATS: raise click.UsageError("Cannot tell the format from the file name, pass --format.")
+
+        progress = lambda report: print(f"{report['imported']} imported, {report['failed']} failed")
+        report = TaskImporter(batch_size=batch_size).run(read_rows(source, format), progress=progress)
+        for error in report['errors']:
+            print(f"line {error['line']}: {error['error']}")
+        if report['failed'] > len(report['errors']):
+            print(f"... and {report['failed'] - len(report['errors'])} more failed rows")
+
+    @app.cli.command("check-indexes")
+    def check_indexes():
+        """
+        Runs EXPLAIN on the query behind each hot endpoint filter and fails if any of them scans a whole table.
+        """
+        checks = {
+            'GET /tasks': Task.query.filter(Task.status == StatusEnum.PENDING).order_by(Task.id.desc()).limit(20),
+            'GET /users/<id>/tasks': Task.query.filter(Task.requester_id == 1, Task.status.notin_(CLOSED_STATUSES)),
+            'GET /users/<id>/seeker/completed-tasks': Task.query.filter(Task.seeker_id == 1, Task.status == StatusEnum.COMPLETED),
+            'GET /users/<id>/applications': Task.query.join(Postulant, Postulant.task_id == Task.id).filter(Postulant.seeker_id == 1).order_by(Postulant.id.desc()),
+            'task applicants': Postulant.query.filter(Postulant.task_id.in_([1, 2])),
+            'GET /tasks/nearby': Address.query.filter(Address.geohash >= 'ezjm', Address.geohash < 'ezjm{'),
+            'task addresses': Task.query.filter(Task.pickup_location_id.in_([1, 2])),
+            'GET /chats/<id>/messages': ChatMessage.query.filter(ChatMessage.chat_id == 1).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()),
+            'GET /users/<id>/chats/<id>': ChatMessage.query.filter(ChatMessage.chat_id == 1, ChatMessage.id > 0, ChatMessage.sender_user_id != 1),
+            'GET /users/<id>/unseen-notifications': Notification.query.filter(Notification.user_id == 1, Notification.seen == False),
+            'GET /users/<id>/notifications': Notification.query.filter(Notification.user_id == 1).order_by(Notification.id.desc()).limit(20),
+            'GET /users/<id>/reviews': Rating.query.filter(Rating.seeker_id == 1),
+            'GET /users/<id>/requester-reviews': Rating.query.filter(Rating.requester_id == 1).order_by(Rating.id.desc()),
+            'task ratings': Rating.query.filter(Rating.task_id.in_([1, 2])),
+            'GET /users/<id>/chats': Chat.query.filter(((Chat.requester_user_id == 1) | (Chat.seeker_user_id == 1)) & (Chat.archived == False)),
+            'PUT /tasks/<id>': Chat.query.filter(Chat.task_id == 1),
+            'GET /addresses/<user_id>': Address.query.filter(Address.user_id == 1),
+            'GET /requesters/user_id/<id>': Requester.query.filter(Requester.user_id == 1),
+            'GET /task-seekers/user_id/<id>': TaskSeeker.query.filter(TaskSeeker.user_id == 1),
+        }
+
+        dialect = db.engine.dialect.name
+        failures = []
+        with db.engine.connect() as connection:
+            transaction = connection.begin()
+            if dialect == 'postgresql':
+                # tiny development tables are always cheaper to scan, ask whether an index is usable at all
+                connection.execute(text("SET LOCAL enable_seqscan = off"))
+            prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+
+            for name, query in checks.items():
+                sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+                plan = [' '.join(str(column) for column in row) for row in connection.execute(text(prefix + sql))]
+                if dialect == 'sqlite':
+                    scans = [line for line in plan if re.search(r'\bSCAN \w+', line) and 'USING' not in line]
+                else:
+                    scans = [line for line in plan if 'Seq Scan' in line]
+                print(('FAIL ' if scans else 'ok   ') + name)
+                for line in plan: print('       ' + line)
+                if scans: failures.append(name)
+            transaction.rollback()
+
+        if failures:
+            print(f"{len(failures)} queries scan a whole table: {', '.join(failures)}")
+            sys.exit(1)
+        print("Every checked query uses an index.")
@@ -0,0 +1,217 @@
+"""
+Bulk task import from CSV or JSON Lines. Rows are read one at a time from the stream and written in
+batches: categories, requesters and addresses resolve through in-memory maps, tasks go out as one
+INSERT ... RETURNING and requester counters as one UPDATE per batch, each batch in its own transaction.
+"""
+import codecs
+import csv
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import update, bindparam, func
+from api.models import db, upsert_addresses, Task, StatusEnum, Category, Requester
+from api.cache import bump_after_commit, TASKS, USERS
+from api.search import index_tasks
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+# rows failing validation are all counted, only the first ones are reported
+MAX_REPORTED_ERRORS = 100
+MAX_BIND_PARAMETERS = 30000
+
+REQUIRED_FIELDS = ('title', 'description', 'due_date', 'budget', 'requester_id',
+                   'delivery_location', 'delivery_lat', 'delivery_lgt', 'pickup_location', 'pickup_lat', 'pickup_lgt')
+FORMATS = ('csv', 'jsonl')
+
+def detect_format(name):
+    """
+    Maps a file name, extension or content type to 'csv' or 'jsonl', None when it is neither.
+    """
+    name = (name or '').lower()
+    if name.endswith('csv'): return 'csv'
+    if name.endswith(('jsonl', 'ndjson', 'json')): return 'jsonl'
+    return None
+
+def read_rows(stream, format):
+    """
+    Yields (line number, row dict or error message) from a binary stream without reading it whole.
+    """
+    text = codecs.getreader('utf-8-sig')(stream)
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip(): continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, 'Invalid JSON.'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Each line must be a JSON object.'
+
+def _limited(row, field, length):
+    value = str(row[field]).strip()
+    if len(value) > length: raise ValueError(f'{field} is longer than {length} characters.')
+    return value
+
+def _coordinate(row, field, bound):
+    try:
+        value = float(row[field])
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number.')
+    if not -bound <= value <= bound: raise ValueError(f'{field} is out of range.')
+    return value
+
+def parse_row(row, categories):
+    """
+    Validates one input row and returns the task values it describes, raising ValueError with the reason otherwise.
+    `categories` maps category ids and lowercased names to ids.
+    """
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if row.get('category_id') in (None, '') and row.get('category') in (None, ''): missing.append('category_id')
+    if missing: raise ValueError(f"Missing fields: {', '.join(missing)}.")
+
+    category = str(row['category_id']).strip() if row.get('category_id') not in (None, '') else str(row['category']).strip().lower()
+    category_id = categories.get(category)
+    if category_id is None: raise ValueError('Category not found.')
+
+    try:
+        due_date = datetime.strptime(str(row['due_date']).strip(), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Invalid due date format.')
+
+    budget = _limited(row, 'budget', Task.budget.type.length)
+    try:
+        float(budget)
+    except ValueError:
+        raise ValueError('budget must be a number.')
+
+    try:
+        requester_user_id = int(row['requester_id'])
+    except (TypeError, ValueError):
+        raise ValueError('requester_id must be a user id.')
+
+    return {
+        'title': _limited(row, 'title', Task.title.type.length),
+        'description': _limited(row, 'description', Task.description.type.length),
+        'due_date': due_date,
+        'budget': budget,
+        'category_id': category_id,
+        'requester_user_id': requester_user_id,
+        'delivery': {'address': _limited(row, 'delivery_location', 120), 'latitude': _coordinate(row, 'delivery_lat', 90), 'longitude': _coordinate(row, 'delivery_lgt', 180)},
+        'pickup': {'address': _limited(row, 'pickup_location', 120), 'latitude': _coordinate(row, 'pickup_lat', 90), 'longitude': _coordinate(row, 'pickup_lgt', 180)},
+    }
+
+def insert_returning(connection, table, rows, columns):
+    """
+    Inserts `rows` and returns `columns` of each new row, with one multi-row INSERT ... RETURNING where the
+    backend has it and one INSERT per row, completed from its primary key, elsewhere.
+    """
+    if connection.dialect.full_returning:
+        # kept well under the 65535 bind parameters a Postgres statement may carry
+        step = max(1, MAX_BIND_PARAMETERS // len(rows[0]))
+        return [row for start in range(0, len(rows), step)
+                for row in connection.execute(table.insert().values(rows[start:start + step]).returning(*columns)).mappings().all()]
+    inserted = [dict(row, id=connection.execute(table.insert(), row).inserted_primary_key[0]) for row in rows]
+    return [{column.key: row[column.key] for column in columns} for row in inserted]
+
+class TaskImporter:
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.categories = {}
+        self.requesters = {}
+        self.addresses = {}
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def report(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': sorted(self.errors, key=lambda error: error['line'])}
+
+    def fail(self, line_number, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS: self.errors.append({'line': line_number, 'error': error})
+
+    def run(self, rows, progress=None):
+        """
+        Imports every (line number, row) of `rows` and returns the report, calling `progress(report)` after each batch.
+        """
+        for category_id, name in db.session.query(Category.id, Category.name):
+            self.categories[str(category_id)] = category_id
+            self.categories[name.strip().lower()] = category_id
+
+        batch = []
+        for line_number, row in rows:
+            if isinstance(row, str):
+                self.fail(line_number, row)
+                continue
+            try:
+                batch.append((line_number, parse_row(row, self.categories)))
+            except ValueError as error:
+                self.fail(line_number, str(error))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                if progress: progress(self.report())
+                batch = []
+        if batch:
+            self.write(batch)
+            if progress: progress(self.report())
+        return self.report()
+
+    def resolve_requesters(self, user_ids):
+        unknown = [user_id for user_id in set(user_ids) if user_id not in self.requesters]
+        if unknown:
+            found = dict(db.session.query(Requester.user_id, Requester.id).filter(Requester.user_id.in_(unknown)).all())
+            for user_id in unknown: self.requesters[user_id] = found.get(user_id)
+
+    def write(self, batch):
+        self.resolve_requesters([task['requester_user_id'] for _, task in batch])
+        valid = []
+        for line_number, task in batch:
+            if self.requesters[task['requester_user_id']] is None: self.fail(line_number, 'Requester with given user ID not found.')
+            else: valid.append((line_number, task))
+        if not valid: return
+
+        try:
+            connection = db.session.connection()
+            new_addresses = [task[kind] for _, task in valid for kind in ('delivery', 'pickup') if task[kind]['address'] not in self.addresses]
+            self.addresses.update(upsert_addresses(connection, new_addresses))
+
+            table = Task.__table__
+            rows = [{
+                'title': task['title'], 'description': task['description'], 'due_date': task['due_date'], 'budget': task['budget'],
+                'status': StatusEnum.PENDING, 'category_id': task['category_id'], 'requester_id': self.requesters[task['requester_user_id']],
+                'delivery_location_id': self.addresses[task['delivery']['address']], 'pickup_location_id': self.addresses[task['pickup']['address']],
+            } for _, task in valid]
+            inserted = insert_returning(connection, table, rows, (table.c.id, table.c.title, table.c.description))
+            # core inserts skip the search and version hooks
+            index_tasks(connection, inserted)
+            self.count_requested(connection, rows)
+            bump_after_commit(db.session, [TASKS, USERS])
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            # the cached ids may belong to rows the rollback just removed
+            self.addresses.clear()
+            for line_number, _ in valid: self.fail(line_number, f'Batch failed: {error.__class__.__name__}.')
+            return
+        self.imported += len(valid)
+
+    def count_requested(self, connection, rows):
+        totals = defaultdict(lambda: [0, 0.0])
+        for row in rows:
+            totals[row['requester_id']][0] += 1
+            totals[row['requester_id']][1] += float(row['budget'])
+
+        table = Requester.__table__
+        requested = func.coalesce(table.c.total_requested_tasks, 0)
+        average = func.coalesce(table.c.average_budget, 0)
+        connection.execute(update(table).where(table.c.id == bindparam('requester_pk')).values({
+            table.c.total_requested_tasks: requested + bindparam('count'),
+            table.c.total_open_tasks: func.coalesce(table.c.total_open_tasks, 0) + bindparam('count'),
+            table.c.average_budget: (average * requested + bindparam('budget')) / (requested + bindparam('count')),
+        }), [{'requester_pk': requester_id, 'count': count, 'budget': budget} for requester_id, (count, budget) in totals.items()])
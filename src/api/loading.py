@@ -0,0 +1,209 @@
+"""
+Named eager-loading profiles and sparse fieldsets for the list endpoints.
+Each profile loads everything the matching serialize() touches, so a list is served
+in a fixed number of queries no matter how many rows it returns.
+"""
+from flask import request
+from sqlalchemy.orm import joinedload, selectinload, load_only
+from api.utils import APIException
+from api.models import DEFAULT_PROFILE_PICTURE, Notification, User, Requester, TaskSeeker, Task, Address, Rating, Postulant, Chat, ChatMessage
+
+# User.serialize() embeds both role profiles, their own user is already in the identity map
+def _user_roles():
+    return [selectinload(User.task_seeker), selectinload(User.requester)]
+
+def _address():
+    return [joinedload(Address.user)]
+
+def _task():
+    return [
+        joinedload(Task.category),
+        joinedload(Task.delivery_address).options(*_address()),
+        joinedload(Task.pickup_address).options(*_address()),
+        joinedload(Task.seeker).joinedload(TaskSeeker.user),
+        joinedload(Task.requester).joinedload(Requester.user).options(*_user_roles()),
+        selectinload(Task.applicants).joinedload(Postulant.seeker).joinedload(TaskSeeker.user),
+        selectinload(Task.ratings).options(joinedload(Rating.seeker), joinedload(Rating.requester)),
+    ]
+
+def _postulant():
+    return [joinedload(Postulant.seeker).joinedload(TaskSeeker.user)]
+
+def _rating():
+    return [joinedload(Rating.seeker), joinedload(Rating.requester), joinedload(Rating.task)]
+
+def _chat():
+    return [
+        joinedload(Chat.requester_user).options(*_user_roles()),
+        joinedload(Chat.seeker_user).options(*_user_roles()),
+    ]
+
+def _chat_message():
+    return [joinedload(ChatMessage.sender_user).options(*_user_roles()), joinedload(ChatMessage.chat)]
+
+PROFILES = {
+    'user': _user_roles,
+    'requester': lambda: [joinedload(Requester.user)],
+    'seeker': lambda: [joinedload(TaskSeeker.user)],
+    'address': _address,
+    'task': _task,
+    'rating': _rating,
+    'postulant': _postulant,
+    'chat': _chat,
+    'chat_message': _chat_message,
+    'notification': lambda: [],
+}
+
+def load_profile(name):
+    return PROFILES[name]()
+
+def with_profile(query, name):
+    return query.options(*load_profile(name))
+
+# Sparse fieldsets: ?fields=a,b and/or ?include=c,d on list endpoints.
+# Each output key of a serialize() maps to the columns it reads, the loader options it needs and a getter,
+# so a sparse request only loads and serializes what it asked for.
+class Field:
+    def __init__(self, getter, columns=(), options=lambda: [], relation=True):
+        self.getter = getter
+        self.columns = columns
+        self.options = options
+        self.relation = relation
+
+def _column(name, convert=lambda value: value):
+    return Field(lambda obj: convert(getattr(obj, name)), columns=(name,), relation=False)
+
+def _columns(*names):
+    return {name: _column(name) for name in names}
+
+def _value(enum):
+    return enum.value if enum else None
+
+def _isoformat(date):
+    return date.isoformat() if date else None
+
+def _user_summary(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "full_name": user.full_name,
+        "description": user.description,
+        "role": user.role.value,
+        "profile_picture": user.profile_picture,
+    }
+
+def _active(role):
+    return role if role and not role.archived else None
+
+FIELDS = {
+    User: dict(
+        _columns('id', 'username', 'email', 'full_name', 'description'),
+        role=_column('role', _value),
+        profile_picture=Field(lambda user: user.profile_picture or DEFAULT_PROFILE_PICTURE, columns=('profile_picture',)),
+        seeker=Field(lambda user: user.task_seeker.serialize() if user.task_seeker else None, options=lambda: [selectinload(User.task_seeker)]),
+        requester=Field(lambda user: user.requester.serialize() if user.requester else None, options=lambda: [selectinload(User.requester)]),
+    ),
+    Requester: dict(
+        _columns('id', 'user_id', 'overall_rating', 'total_reviews', 'total_requested_tasks', 'average_budget', 'total_open_tasks', 'archived'),
+        rating_histogram=Field(lambda profile: profile.rating_histogram(), columns=tuple(f'stars_{stars}' for stars in range(1, 6)), relation=False),
+        user=Field(lambda requester: _user_summary(requester.user), columns=('user_id',), options=lambda: [joinedload(Requester.user)]),
+    ),
+    TaskSeeker: dict(
+        _columns('id', 'user_id', 'overall_rating', 'total_reviews', 'total_completed_tasks', 'total_ongoing_tasks', 'archived'),
+        rating_histogram=Field(lambda profile: profile.rating_histogram(), columns=tuple(f'stars_{stars}' for stars in range(1, 6)), relation=False),
+        user=Field(lambda seeker: _user_summary(seeker.user), columns=('user_id',), options=lambda: [joinedload(TaskSeeker.user)]),
+    ),
+    Address: dict(
+        _columns('id', 'address', 'latitude', 'longitude'),
+        user_id=Field(lambda address: address.user_id if address.user else None, columns=('user_id',), options=_address),
+        username=Field(lambda address: address.user.username if address.user else None, columns=('user_id',), options=_address),
+    ),
+    Task: dict(
+        _columns('id', 'title', 'description', 'delivery_location_id', 'pickup_location_id', 'category_id', 'budget'),
+        creation_date=_column('creation_date', _isoformat),
+        due_date=_column('due_date', _isoformat),
+        status=_column('status', _value),
+        delivery_address=Field(lambda task: task.delivery_address.serialize(), columns=('delivery_location_id',),
+                               options=lambda: [joinedload(Task.delivery_address).options(*_address())]),
+        pickup_address=Field(lambda task: task.pickup_address.serialize(), columns=('pickup_location_id',),
+                             options=lambda: [joinedload(Task.pickup_address).options(*_address())]),
+        seeker_id=Field(lambda task: task.seeker_id if _active(task.seeker) else None, columns=('seeker_id',), options=lambda: [joinedload(Task.seeker)]),
+        seeker=Field(lambda task: task.seeker.serialize() if _active(task.seeker) else None, columns=('seeker_id',),
+                     options=lambda: [joinedload(Task.seeker).joinedload(TaskSeeker.user)]),
+        requester_id=Field(lambda task: task.requester_id if _active(task.requester) else None, columns=('requester_id',), options=lambda: [joinedload(Task.requester)]),
+        requester_user=Field(lambda task: task.requester.user.serialize() if _active(task.requester) else None, columns=('requester_id',),
+                             options=lambda: [joinedload(Task.requester).joinedload(Requester.user).options(*_user_roles())]),
+        category_name=Field(lambda task: task.category.name, columns=('category_id',), options=lambda: [joinedload(Task.category)]),
+        applicants=Field(lambda task: [applicant.serialize() for applicant in task.applicants],
+                         options=lambda: [selectinload(Task.applicants).joinedload(Postulant.seeker).joinedload(TaskSeeker.user)]),
+        ratings=Field(lambda task: [rating.serialize() for rating in task.ratings],
+                      options=lambda: [selectinload(Task.ratings).options(joinedload(Rating.seeker), joinedload(Rating.requester))]),
+    ),
+    Rating: dict(
+        _columns('id', 'stars', 'seeker_id', 'requester_id', 'task_id', 'review'),
+        seeker_username=Field(lambda rating: rating.seeker.username if rating.seeker else None, columns=('seeker_id',), options=lambda: [joinedload(Rating.seeker)]),
+        seeker_picture=Field(lambda rating: rating.seeker.profile_picture if rating.seeker else None, columns=('seeker_id',), options=lambda: [joinedload(Rating.seeker)]),
+        seeker_role=Field(lambda rating: rating.seeker.role.value if rating.seeker else None, columns=('seeker_id',), options=lambda: [joinedload(Rating.seeker)]),
+        requester_username=Field(lambda rating: rating.requester.username if rating.requester else None, columns=('requester_id',), options=lambda: [joinedload(Rating.requester)]),
+        requester_picture=Field(lambda rating: rating.requester.profile_picture if rating.requester else None, columns=('requester_id',), options=lambda: [joinedload(Rating.requester)]),
+        requester_role=Field(lambda rating: rating.requester.role.value if rating.requester else None, columns=('requester_id',), options=lambda: [joinedload(Rating.requester)]),
+        task_title=Field(lambda rating: rating.task.title if rating.task else None, columns=('task_id',), options=lambda: [joinedload(Rating.task)]),
+    ),
+    Postulant: dict(
+        _columns('id', 'status', 'task_id', 'seeker_id', 'price'),
+        application_date=_column('application_date', _isoformat),
+        seeker=Field(lambda postulant: postulant.seeker.serialize(), columns=('seeker_id',), options=_postulant),
+    ),
+    Notification: dict(
+        _columns('id', 'message', 'seen', 'user_id'),
+        date=_column('creation_date'),
+    ),
+    Chat: dict(
+        _columns('id', 'room_name', 'task_id', 'requester_user_id', 'seeker_user_id'),
+        task_title=Field(lambda chat: chat.task.title if chat.task else None, columns=('task_id',), options=lambda: [joinedload(Chat.task)]),
+        requester_user=Field(lambda chat: chat.requester_user.serialize(), columns=('requester_user_id',),
+                             options=lambda: [joinedload(Chat.requester_user).options(*_user_roles())]),
+        seeker_user=Field(lambda chat: chat.seeker_user.serialize(), columns=('seeker_user_id',),
+                          options=lambda: [joinedload(Chat.seeker_user).options(*_user_roles())]),
+    ),
+    ChatMessage: dict(
+        _columns('id', 'client_generated_id', 'sender_user_id', 'chat_id', 'message', 'timestamp', 'seen'),
+        sender_user=Field(lambda message: message.sender_user.serialize(), columns=('sender_user_id',),
+                          options=lambda: [joinedload(ChatMessage.sender_user).options(*_user_roles())]),
+        room_name=Field(lambda message: message.chat.room_name, columns=('chat_id',), options=lambda: [joinedload(ChatMessage.chat)]),
+    ),
+}
+
+def requested_fields(model):
+    """
+    Returns the output keys asked for with ?fields= and ?include=, or None for the full representation.
+    `include` alone adds relationship keys on top of every plain column.
+    """
+    fields = [field for field in request.args.get('fields', '').split(',') if field]
+    include = [field for field in request.args.get('include', '').split(',') if field]
+    if not fields and not include: return None
+
+    available = FIELDS[model]
+    if not fields:
+        fields = [key for key, field in available.items() if not field.relation]
+    unknown = [field for field in fields + include if field not in available]
+    if unknown: raise APIException(f"Unknown field: {', '.join(unknown)}.", status_code=400)
+    return tuple(dict.fromkeys(fields + include))
+
+def with_fields(query, model, fields, profile):
+    """
+    Applies the full loading profile, or for a sparse request only the columns and relationships its fields read.
+    """
+    if fields is None: return with_profile(query, profile)
+
+    columns, options = {model.__mapper__.primary_key[0].key}, []
+    for key in fields:
+        columns.update(FIELDS[model][key].columns)
+        options += FIELDS[model][key].options()
+    return query.options(load_only(*columns), *options)
+
+def dump(obj, fields):
+    if fields is None: return obj.serialize()
+    available = FIELDS[type(obj)]
+    return {key: available[key].getter(obj) for key in fields}
@@ -1,9 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, event, inspect, select, case, cast, and_, or_, Float
+from api.utils import geohash_encode, geohash_cells, haversine_km
 from enum import Enum
 
 db = SQLAlchemy()
 
+def upsert(connection, table):
+    """
+    Returns an INSERT into `table` supporting on_conflict_do_nothing/on_conflict_do_update
+    for the dialect of `connection` (PostgreSQL and SQLite).
+    """
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+DEFAULT_PROFILE_PICTURE = 'https://res.cloudinary.com/doojwu2m7/image/upload/v1717762751/u0tkpx1d2u7rybaq8y6y.jpg'
+
 class RoleEnum(Enum):
     TASK_SEEKER = "task_seeker"
     REQUESTER = "requester"
@@ -19,6 +33,8 @@ class User(db.Model):
     role = db.Column(db.Enum(RoleEnum), nullable=True, default=RoleEnum.NONE)
     description = db.Column(db.String(500), unique=False, nullable=True)
     profile_picture = db.Column(db.String(500), unique=False, nullable=True)  # Nuevo campo
+    # maintained by adjust_unread_notifications, never recounted on read
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     requester = db.relationship('Requester', uselist=False, back_populates='user')
     task_seeker = db.relationship('TaskSeeker', uselist=False, back_populates='user')
@@ -34,17 +50,33 @@ class User(db.Model):
             "full_name": self.full_name,
             "role": self.role.value,
             "description": self.description,
-            "profile_picture": self.profile_picture or 'https://res.cloudinary.com/doojwu2m7/image/upload/v1717762751/u0tkpx1d2u7rybaq8y6y.jpg',  # Nuevo campo
+            "profile_picture": self.profile_picture or DEFAULT_PROFILE_PICTURE,  # Nuevo campo
             "seeker": self.task_seeker.serialize() if self.task_seeker else None,
             "requester": self.requester.serialize() if self.requester else None
         }
+
+    def serialize_summary(self):
+        return {
+            "id": self.id,
+            "username": self.username,
+            "full_name": self.full_name,
+            "role": self.role.value,
+            "profile_picture": self.profile_picture or DEFAULT_PROFILE_PICTURE,
+        }
     
 class Requester(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship('User', back_populates='requester')
     overall_rating = db.Column(db.Float, unique=False, nullable=True, default=0)
     total_reviews = db.Column(db.Integer, unique=False, nullable=True, default=0)
+    # rating aggregates, only ever moved by adjust_rating_stats
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     total_requested_tasks = db.Column(db.Integer, unique=False, nullable=True, default=0)
     average_budget = db.Column(db.Float, unique=False, nullable=True, default=0)
     total_open_tasks = db.Column(db.Integer, unique=False, nullable=True, default=0)
@@ -53,6 +85,9 @@ class Requester(db.Model):
     def archive(self):
         self.archived = True
 
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
     def __repr__(self):
         return f'<Requester {self.user.username}>'
 
@@ -71,6 +106,7 @@ class Requester(db.Model):
             "user_id": self.user_id,
             "overall_rating": self.overall_rating,
             "total_reviews": self.total_reviews,
+            "rating_histogram": self.rating_histogram(),
             "total_requested_tasks": self.total_requested_tasks,
             "average_budget": self.average_budget,
             "total_open_tasks": self.total_open_tasks,
@@ -79,10 +115,17 @@ class Requester(db.Model):
     
 class TaskSeeker(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship('User', back_populates='task_seeker')
     overall_rating = db.Column(db.Float, unique=False, nullable=True, default=0)
     total_reviews = db.Column(db.Integer, unique=False, nullable=True, default=0)
+    # rating aggregates, only ever moved by adjust_rating_stats
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stars_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     total_completed_tasks = db.Column(db.Integer, unique=False, nullable=True, default=0)
     total_ongoing_tasks = db.Column(db.Integer, unique=False, nullable=True, default=0)
     archived = db.Column(db.Boolean, default=False)
@@ -90,6 +133,9 @@ class TaskSeeker(db.Model):
     def archive(self):
         self.archived = True
 
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
     def __repr__(self):
         return f'<Seeker {self.user.username}>'
 
@@ -108,6 +154,7 @@ class TaskSeeker(db.Model):
             "user_id": self.user_id,
             "overall_rating": self.overall_rating,
             "total_reviews": self.total_reviews,
+            "rating_histogram": self.rating_histogram(),
             "total_completed_tasks": self.total_completed_tasks,
             "total_ongoing_tasks": self.total_ongoing_tasks,
             "archived": self.archived,
@@ -119,7 +166,15 @@ class StatusEnum(Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+CLOSED_STATUSES = (StatusEnum.COMPLETED, StatusEnum.CANCELLED)
+
 class Task(db.Model):
+    __table_args__ = (
+        db.Index('ix_task_status_id', 'status', 'id'),
+        db.Index('ix_task_requester_id_status', 'requester_id', 'status'),
+        db.Index('ix_task_seeker_id_status', 'seeker_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80), unique=False, nullable=False)
     description = db.Column(db.String(500), unique=False, nullable=False)
@@ -127,9 +182,9 @@ class Task(db.Model):
     due_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.Enum(StatusEnum), nullable=False, default=StatusEnum.PENDING)
     budget = db.Column(db.String(10), unique=False, nullable=False)
-    delivery_location_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False)
+    delivery_location_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False, index=True)
     delivery_address = db.relationship('Address', foreign_keys=[delivery_location_id], backref=db.backref('dropoffs', lazy=True))
-    pickup_location_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False)
+    pickup_location_id = db.Column(db.Integer, db.ForeignKey('address.id'), nullable=False, index=True)
     pickup_address = db.relationship('Address', foreign_keys=[pickup_location_id], backref=db.backref('pickups', lazy=True))
     requester_id = db.Column(db.Integer, db.ForeignKey('requester.id'), nullable=False)
     requester = db.relationship('Requester', backref=db.backref('tasks', lazy=True))
@@ -169,11 +224,13 @@ class Task(db.Model):
     
 class Address(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     user = db.relationship('User', backref=db.backref('addresses', lazy=True))
     address = db.Column(db.String(120), unique=True, nullable=False)
     latitude = db.Column(db.Float, unique=False, nullable=False)
     longitude = db.Column(db.Float, unique=False, nullable=False)
+    # spatial index key, kept in sync with latitude/longitude by the mapper events below
+    geohash = db.Column(db.String(12), unique=False, nullable=True, index=True)
 
     def __repr__(self):
         return f'<Address {self.address}>'
@@ -187,6 +244,42 @@ class Address(db.Model):
             "user_id": self.user_id if self.user else None,
             "username": self.user.username if self.user else None
         }
+
+@event.listens_for(Address, 'before_insert')
+@event.listens_for(Address, 'before_update')
+def set_address_geohash(mapper, connection, address):
+    if address.latitude is not None and address.longitude is not None:
+        address.geohash = geohash_encode(address.latitude, address.longitude)
+
+def addresses_within(latitude, longitude, radius_km):
+    """
+    Returns (address id, user id, distance in km) for every address within `radius_km` of the point.
+    Candidates come from a range scan of the geohash index, the exact distance is only computed for them.
+    """
+    cells = [and_(Address.geohash >= cell, Address.geohash < cell + '{') for cell in geohash_cells(latitude, longitude, radius_km)]
+    candidates = db.session.query(Address.id, Address.user_id, Address.latitude, Address.longitude).filter(or_(*cells)).all()
+    results = []
+    for address_id, user_id, address_latitude, address_longitude in candidates:
+        distance = haversine_km(latitude, longitude, address_latitude, address_longitude)
+        if distance <= radius_km: results.append((address_id, user_id, distance))
+    return results
+
+def upsert_addresses(connection, addresses):
+    """
+    Inserts each {'address', 'latitude', 'longitude'} that does not exist yet and returns {address: id} for those that exist now.
+    Concurrent posts of the same address resolve to the one row that won instead of violating the unique constraint.
+    An existing address keeps its stored coordinates, one without coordinates is only looked up.
+    """
+    rows = list({address['address']: address for address in addresses}.values())
+    if not rows: return {}
+    table = Address.__table__
+    new_rows = [row for row in rows if row['latitude'] is not None and row['longitude'] is not None]
+    if new_rows:
+        # core inserts skip set_address_geohash, the key is computed here instead
+        connection.execute(upsert(connection, table).on_conflict_do_nothing(index_elements=['address']), [
+            dict(row, geohash=geohash_encode(row['latitude'], row['longitude'])) for row in new_rows
+        ])
+    return dict(connection.execute(select(table.c.address, table.c.id).where(table.c.address.in_([row['address'] for row in rows]))).all())
     
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -195,21 +288,30 @@ class Category(db.Model):
     def __repr__(self):
         return f'<User %r {self.name}>'
 
-    def serialize(self):
-        pending_tasks = [task.serialize() for task in self.tasks if task.status == StatusEnum.PENDING]
+    def serialize(self, pending_tasks=None):
+        if pending_tasks is None:
+            pending_tasks = [task for task in self.tasks if task.status == StatusEnum.PENDING]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "tasks": [task.serialize() for task in pending_tasks],
+        }
+
+    def serialize_summary(self, pending_tasks):
         return {
             "id": self.id,
             "name": self.name,
-            "tasks": pending_tasks,
+            "pending_tasks": pending_tasks,
         }
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
     id = db.Column(db.Integer, primary_key=True)
-    stars = db.Column(db.Integer, nullable=False)
-    seeker_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    requester_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    # the previous value is always loaded so the rating stat hooks can take it back out
+    stars = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
+    seeker_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    requester_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
     review = db.Column(db.String(500), unique=False, nullable=True)
     
     # Relationships
@@ -237,12 +339,59 @@ class Rating(db.Model):
             "review": self.review,
         }
 
+# Rating.seeker_id rates the user's seeker profile, Rating.requester_id their requester profile
+RATING_TARGETS = (('seeker_id', TaskSeeker), ('requester_id', Requester))
+
+def adjust_rating_stats(connection, model, user_id, stars, delta):
+    """
+    Adds (delta=1) or takes back (delta=-1) one rating of `stars` on the profile of `user_id` in a single UPDATE,
+    the mean is computed from the pre-update columns so concurrent ratings never overwrite each other.
+    """
+    table = model.__table__
+    total_reviews = func.coalesce(table.c.total_reviews, 0) + delta
+    rating_sum = table.c.rating_sum + delta * stars
+    connection.execute(table.update().where(table.c.user_id == user_id).values({
+        table.c.total_reviews: total_reviews,
+        table.c.rating_sum: rating_sum,
+        table.c[f'stars_{stars}']: table.c[f'stars_{stars}'] + delta,
+        table.c.overall_rating: case((total_reviews > 0, cast(rating_sum, Float) / total_reviews), else_=0),
+    }))
+
+def _previous(state, key):
+    history = state.attrs[key].history
+    if not history.has_changes(): return getattr(state.object, key)
+    return history.deleted[0] if history.deleted else None
+
+@event.listens_for(Rating, 'after_insert')
+def count_new_rating(mapper, connection, rating):
+    for column, model in RATING_TARGETS:
+        if getattr(rating, column): adjust_rating_stats(connection, model, getattr(rating, column), rating.stars, 1)
+
+@event.listens_for(Rating, 'after_update')
+def recount_edited_rating(mapper, connection, rating):
+    state = inspect(rating)
+    if not any(state.attrs[key].history.has_changes() for key in ('stars', 'seeker_id', 'requester_id')): return
+    previous_stars = _previous(state, 'stars')
+    for column, model in RATING_TARGETS:
+        previous_user_id = _previous(state, column)
+        if previous_user_id: adjust_rating_stats(connection, model, previous_user_id, previous_stars, -1)
+        if getattr(rating, column): adjust_rating_stats(connection, model, getattr(rating, column), rating.stars, 1)
+
+@event.listens_for(Rating, 'after_delete')
+def uncount_deleted_rating(mapper, connection, rating):
+    for column, model in RATING_TARGETS:
+        if getattr(rating, column): adjust_rating_stats(connection, model, getattr(rating, column), rating.stars, -1)
+
 class Postulant(db.Model):
+    __table_args__ = (
+        db.Index('ix_postulant_seeker_id_id', 'seeker_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     application_date = db.Column(db.DateTime(timezone=True), default=func.now(), nullable=False)
     status = db.Column(db.String(120), nullable=False)
     price = db.Column(db.String(120), nullable=False)
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
     seeker_id = db.Column(db.Integer, db.ForeignKey('task_seeker.id'), nullable=False)
     task = db.relationship('Task', backref=db.backref('applicants', lazy=True))
     seeker = db.relationship('TaskSeeker')
@@ -263,12 +412,18 @@ class Postulant(db.Model):
         }
     
 class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_user_id_id', 'user_id', 'id'),
+        db.Index('ix_notification_user_id_unseen', 'user_id', postgresql_where=db.text('seen = false'), sqlite_where=db.text('seen = 0')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     creation_date = db.Column(db.DateTime(timezone=True), default=func.now(), nullable=False)
     message = db.Column(db.String(120), nullable=False, unique=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     user = db.relationship('User', backref=db.backref('notifications', lazy=True))
-    seen = db.Column(db.Boolean, default=False)
+    # the previous value is always loaded so count_seen_notification can tell whether the flag flipped
+    seen = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
 
     def __repr__(self):
         return f'<Notification {self.user.username} - {self.message} - Seen: {self.seen}>'
@@ -282,13 +437,39 @@ class Notification(db.Model):
             "user_id": self.user_id,
         }
     
+def adjust_unread_notifications(connection, deltas):
+    """
+    Applies {user id: delta} to the unread notification counters with one atomic UPDATE per distinct delta.
+    """
+    by_delta = {}
+    for user_id, delta in deltas.items():
+        if user_id is not None and delta: by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        connection.execute(User.__table__.update().where(User.__table__.c.id.in_(user_ids))
+                           .values(unread_notifications=User.__table__.c.unread_notifications + delta))
+
+@event.listens_for(Notification, 'after_insert')
+def count_new_notification(mapper, connection, notification):
+    if not notification.seen: adjust_unread_notifications(connection, {notification.user_id: 1})
+
+@event.listens_for(Notification, 'after_update')
+def count_seen_notification(mapper, connection, notification):
+    history = inspect(notification).attrs.seen.history
+    if not history.has_changes(): return
+    delta = int(not notification.seen) - int(not (history.deleted and history.deleted[0]))
+    adjust_unread_notifications(connection, {notification.user_id: delta})
+
+@event.listens_for(Notification, 'after_delete')
+def count_deleted_notification(mapper, connection, notification):
+    if not notification.seen: adjust_unread_notifications(connection, {notification.user_id: -1})
+
 class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    requester_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    requester_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     requester_user = db.relationship('User', foreign_keys=[requester_user_id])
-    seeker_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    seeker_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     seeker_user = db.relationship('User', foreign_keys=[seeker_user_id])
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'))
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), index=True)
     task = db.relationship('Task')
     room_name = db.Column(db.String, nullable=False)
     archived = db.Column(db.Boolean, default=False)
@@ -306,6 +487,11 @@ class Chat(db.Model):
         }
     
 class ChatMessage(db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_message_chat_id_timestamp', 'chat_id', 'timestamp', 'id'),
+        db.Index('ix_chat_message_chat_id_id', 'chat_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     client_generated_id = db.Column(db.String(36), unique=True, nullable=False)
     sender_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -332,6 +518,35 @@ class ChatMessage(db.Model):
             "seen": self.seen
         }
 
+    def serialize_summary(self):
+        # senders are sent once per page alongside, see get_messages
+        return {
+            "id": self.id,
+            "client_generated_id": self.client_generated_id,
+            "sender_user_id": self.sender_user_id,
+            "chat_id": self.chat_id,
+            "message": self.message,
+            "timestamp": self.timestamp,
+            "seen": self.seen
+        }
+
+class ChatReadReceipt(db.Model):
+    # how far each participant has read a chat, unread messages are the ones past it, see api/realtime.py
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_seen_message_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ChatReadReceipt chat {self.chat_id} user {self.user_id} up to {self.last_seen_message_id}>'
+
+class VersionStamp(db.Model):
+    # bumped right after every commit that wrote data behind a cached read, see api/cache.py
+    key = db.Column(db.String(120), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersionStamp {self.key}={self.version}>'
+
 class AdminUser(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
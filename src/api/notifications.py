@@ -0,0 +1,82 @@
+"""
+Notification fan-out. Callers name their recipients (user ids, usernames, the participants of a chat room
+or everyone with an address near a point) and get control back at once; a background worker resolves them
+in one query, inserts the Notification rows in batches and emits to each recipient's socket room.
+"""
+import os
+import queue
+import threading
+
+from sqlalchemy import or_, select
+from api.models import db, addresses_within, adjust_unread_notifications, User, Chat, Notification
+from api.cache import bump_after_commit, notifications_key
+from api.realtime import user_room
+
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '500'))
+
+class NotificationService:
+    def __init__(self, batch_size=NOTIFICATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+        self.app = None
+        self.socketio = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+
+    def notify(self, message, user_ids=(), usernames=(), room=None, near=None):
+        """
+        Queues `message` for every user matched by any of the targets, `near` is (latitude, longitude, radius_km).
+        """
+        self.jobs.put({'message': message, 'user_ids': list(user_ids), 'usernames': list(usernames), 'room': room, 'near': near})
+        with self.lock:
+            if self.running: return
+            self.running = True
+        self.socketio.start_background_task(self.run)
+
+    def run(self):
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    if self.jobs.empty():
+                        self.running = False
+                        return
+                continue
+            try:
+                with self.app.app_context():
+                    self.deliver(job)
+            except Exception:
+                self.app.logger.exception('Notification delivery failed')
+
+    def recipients(self, job):
+        targets = []
+        if job['user_ids']: targets.append(User.id.in_(job['user_ids']))
+        if job['usernames']: targets.append(User.username.in_(job['usernames']))
+        if job['room']:
+            targets.append(User.id.in_(select(Chat.requester_user_id).where(Chat.room_name == job['room'])))
+            targets.append(User.id.in_(select(Chat.seeker_user_id).where(Chat.room_name == job['room'])))
+        if job['near']:
+            nearby = {user_id for _, user_id, _ in addresses_within(*job['near']) if user_id is not None}
+            if nearby: targets.append(User.id.in_(nearby))
+        if not targets: return []
+        return db.session.query(User.id, User.username).filter(or_(*targets)).order_by(User.id).all()
+
+    def deliver(self, job):
+        recipients = self.recipients(job)
+        for start in range(0, len(recipients), self.batch_size):
+            batch = recipients[start:start + self.batch_size]
+            connection = db.session.connection()
+            connection.execute(Notification.__table__.insert(), [{'user_id': user_id, 'message': job['message'], 'seen': False} for user_id, _ in batch])
+            # core inserts skip the mapper and flush hooks that keep the counters and inbox caches fresh
+            adjust_unread_notifications(connection, {user_id: 1 for user_id, _ in batch})
+            bump_after_commit(db.session, [notifications_key(user_id) for user_id, _ in batch])
+            db.session.commit()
+            for _, username in batch:
+                self.socketio.emit('notification', {'message': job['message']}, room=user_room(username))
+
+notification_service = NotificationService()
@@ -0,0 +1,611 @@
+"""
+Socket.IO scale-out: the message queue the workers share and the presence/typing state behind it.
+With SOCKETIO_MESSAGE_QUEUE unset everything stays in this process, which is only correct for a single worker.
+redis:// (or rediss://) fans emits out through Redis pub/sub and keeps the state in Redis as well,
+local:// is an in-process stand-in that runs the same pub/sub code path without any external service.
+"""
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timezone
+
+import socketio
+from sqlalchemy import or_, select
+from sqlalchemy.orm import aliased
+from api.models import db, upsert, User, Chat, ChatMessage, ChatReadReceipt
+from api.cache import bump_after_commit, chat_messages_key
+
+MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'flask-socketio')
+# seconds of connects and disconnects folded into one round of presence events
+PRESENCE_WINDOW = float(os.getenv('SOCKETIO_PRESENCE_WINDOW', '0.5'))
+# a worker that has not heartbeated for this many seconds is considered dead and its connections are released
+PRESENCE_TTL = int(os.getenv('SOCKETIO_PRESENCE_TTL', '30'))
+# a room's typing_status goes out at most once per interval, a silent typist expires after the ttl
+TYPING_INTERVAL = float(os.getenv('SOCKETIO_TYPING_INTERVAL', '0.3'))
+TYPING_TTL = float(os.getenv('SOCKETIO_TYPING_TTL', '6'))
+# socket chat messages are inserted in batches of up to this many rows, at least once per interval
+MESSAGE_BATCH_SIZE = int(os.getenv('CHAT_MESSAGE_BATCH_SIZE', '100'))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('CHAT_MESSAGE_FLUSH_INTERVAL', '0.2'))
+# largest value of an INTEGER column, bigger chat ids are rejected before they reach a query
+MAX_ID = 2**31 - 1
+
+class LocalManager(socketio.PubSubManager):
+    """
+    Message queue stand-in for tests and local runs: every manager on the same channel in this
+    process shares one in-memory bus, so several SocketIO servers behave like separate workers.
+    """
+    name = 'local'
+    channels = {}
+    lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.inbox = queue.Queue()
+        if not write_only:
+            with self.lock:
+                self.channels.setdefault(channel, []).append(self.inbox)
+
+    def _publish(self, data):
+        # encoded like a real queue would, so nothing unserializable slips through in tests
+        message = self.json.dumps(data)
+        for inbox in list(self.channels.get(self.channel, [])):
+            inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield self.inbox.get()
+
+def socketio_options(url=MESSAGE_QUEUE, channel=CHANNEL):
+    """
+    Keyword arguments for SocketIO() selecting the message queue, none for a single process.
+    """
+    if not url: return {}
+    if url.startswith('local://'): return {'client_manager': LocalManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+class MemoryState:
+    """
+    Presence and typing state of a single process. Users are counted per connection,
+    so a second tab does not take them offline when the first one closes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.connections = {}
+        # room -> {username: deadline}, expired typists are dropped when the room is read
+        self.typing = {}
+
+    def connect(self, sid, username):
+        """Returns True when this is the user's first connection."""
+        with self.lock:
+            self.sessions[sid] = username
+            self.connections[username] = self.connections.get(username, 0) + 1
+            return self.connections[username] == 1
+
+    def disconnect(self, sid):
+        """Returns the session's username and whether that was the user's last connection."""
+        with self.lock:
+            username = self.sessions.pop(sid, None)
+            if username is None: return None, False
+            self.connections[username] -= 1
+            if self.connections[username] > 0: return username, False
+            del self.connections[username]
+            return username, True
+
+    def username(self, sid):
+        return self.sessions.get(sid)
+
+    def online(self, usernames):
+        """Returns the subset of `usernames` with at least one connection."""
+        with self.lock:
+            return {username for username in usernames if username in self.connections}
+
+    def start_typing(self, room, username, ttl):
+        """Returns True when the room's typing set changed, an entry expires `ttl` seconds after its last refresh."""
+        now = time.time()
+        with self.lock:
+            users = self.typing.setdefault(room, {})
+            changed = users.get(username, 0) <= now
+            users[username] = now + ttl
+            return changed
+
+    def stop_typing(self, room, username):
+        with self.lock:
+            users = self.typing.get(room)
+            if not users or username not in users: return False
+            deadline = users.pop(username)
+            if not users: del self.typing[room]
+            return deadline > time.time()
+
+    def typing_users(self, room):
+        now = time.time()
+        with self.lock:
+            users = self.typing.get(room, {})
+            for username in [username for username, deadline in users.items() if deadline <= now]:
+                del users[username]
+            if not users: self.typing.pop(room, None)
+            return sorted(users)
+
+    def stop_typing_everywhere(self, username):
+        """Returns the rooms the user was typing in."""
+        with self.lock:
+            rooms = [room for room, users in self.typing.items() if username in users]
+        return [room for room in rooms if self.stop_typing(room, username)]
+
+class RedisState:
+    """
+    The same state kept in Redis so every worker sees every connection. Counters and sets are
+    updated with single atomic commands, no read-modify-write happens in Python. Each worker keeps
+    its sessions under its own id and heartbeats a key expiring after `ttl` seconds, the sessions
+    of a worker whose key expired are released by whichever worker notices first.
+    """
+    SESSIONS = 'presence:sessions'
+    CONNECTIONS = 'presence:connections'
+    WORKERS = 'presence:workers'
+    ALIVE = 'presence:alive'
+    # claims a dead worker's sessions and takes their connections off the counters in one step
+    RELEASE_WORKER = (
+        "if redis.call('srem', KEYS[1], ARGV[1]) == 0 then return {} end "
+        "local offline = {} "
+        "for _, username in ipairs(redis.call('hvals', KEYS[2])) do "
+        "if redis.call('hincrby', KEYS[3], username, -1) <= 0 then "
+        "redis.call('hdel', KEYS[3], username) table.insert(offline, username) end end "
+        "redis.call('del', KEYS[2]) return offline"
+    )
+
+    def __init__(self, client, prefix=CHANNEL, ttl=PRESENCE_TTL):
+        self.redis = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.worker = uuid.uuid4().hex
+
+    def key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def sessions_key(self, worker=None):
+        return self.key(self.SESSIONS, worker or self.worker)
+
+    def heartbeat(self):
+        """
+        Marks this worker alive for another `ttl` seconds and releases the sessions of workers that
+        stopped heartbeating. Returns the usernames that lost their last connection that way.
+        """
+        pipe = self.redis.pipeline()
+        pipe.set(self.key(self.ALIVE, self.worker), 1, ex=self.ttl)
+        pipe.sadd(self.key(self.WORKERS), self.worker)
+        pipe.smembers(self.key(self.WORKERS))
+        workers = [worker.decode() for worker in pipe.execute()[2]]
+        offline = []
+        for worker in workers:
+            if worker == self.worker or self.redis.exists(self.key(self.ALIVE, worker)): continue
+            released = self.redis.eval(self.RELEASE_WORKER, 3, self.key(self.WORKERS), self.sessions_key(worker), self.key(self.CONNECTIONS), worker)
+            offline += [username.decode() for username in released]
+        return offline
+
+    def connect(self, sid, username):
+        pipe = self.redis.pipeline()
+        pipe.hset(self.sessions_key(), sid, username)
+        pipe.hincrby(self.key(self.CONNECTIONS), username, 1)
+        # registered alive here too, a connection may come in before the first heartbeat
+        pipe.set(self.key(self.ALIVE, self.worker), 1, ex=self.ttl)
+        pipe.sadd(self.key(self.WORKERS), self.worker)
+        return pipe.execute()[1] == 1
+
+    def disconnect(self, sid):
+        username = self.username(sid)
+        if username is None: return None, False
+        if not self.redis.hdel(self.sessions_key(), sid): return username, False
+        # decrement and drop in one step, another worker may be connecting the same user
+        offline = self.redis.eval(
+            "local count = redis.call('hincrby', KEYS[1], ARGV[1], -1) "
+            "if count <= 0 then redis.call('hdel', KEYS[1], ARGV[1]) return 1 end return 0",
+            1, self.key(self.CONNECTIONS), username,
+        )
+        return username, bool(offline)
+
+    def username(self, sid):
+        username = self.redis.hget(self.sessions_key(), sid)
+        return username.decode() if username is not None else None
+
+    def online(self, usernames):
+        usernames = list(usernames)
+        if not usernames: return set()
+        counts = self.redis.hmget(self.key(self.CONNECTIONS), usernames)
+        return {username for username, count in zip(usernames, counts) if count is not None and int(count) > 0}
+
+    def start_typing(self, room, username, ttl):
+        # typists are a sorted set scored by deadline, an entry nobody refreshes expires in Redis itself
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.zscore(self.key('typing', room), username)
+        pipe.zadd(self.key('typing', room), {username: now + ttl})
+        pipe.expire(self.key('typing', room), math.ceil(ttl))
+        pipe.sadd(self.key('typing-rooms', username), room)
+        pipe.expire(self.key('typing-rooms', username), math.ceil(ttl))
+        deadline = pipe.execute()[0]
+        return deadline is None or deadline <= now
+
+    def stop_typing(self, room, username):
+        pipe = self.redis.pipeline()
+        pipe.zscore(self.key('typing', room), username)
+        pipe.zrem(self.key('typing', room), username)
+        pipe.srem(self.key('typing-rooms', username), room)
+        deadline = pipe.execute()[0]
+        return deadline is not None and deadline > time.time()
+
+    def typing_users(self, room):
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(self.key('typing', room), '-inf', time.time())
+        pipe.zrange(self.key('typing', room), 0, -1)
+        return sorted(username.decode() for username in pipe.execute()[1])
+
+    def stop_typing_everywhere(self, username):
+        rooms = [room.decode() for room in self.redis.smembers(self.key('typing-rooms', username))]
+        return [room for room in rooms if self.stop_typing(room, username)]
+
+def user_room(username):
+    # every connection joins its user's room, presence events are addressed to users, not to sockets
+    return f'user:{username}'
+
+def chat_partners(usernames):
+    """
+    Maps each of `usernames` to the usernames it shares an active chat with, in one query.
+    """
+    usernames = set(usernames)
+    requester_user, seeker_user = aliased(User), aliased(User)
+    rows = db.session.query(requester_user.username, seeker_user.username).select_from(Chat).join(
+        requester_user, requester_user.id == Chat.requester_user_id
+    ).join(
+        seeker_user, seeker_user.id == Chat.seeker_user_id
+    ).filter(Chat.archived == False, or_(requester_user.username.in_(usernames), seeker_user.username.in_(usernames))).all()
+
+    partners = defaultdict(set)
+    for requester, seeker in rows:
+        if requester in usernames: partners[requester].add(seeker)
+        if seeker in usernames: partners[seeker].add(requester)
+    return partners
+
+class PresenceBroadcaster:
+    """
+    Sends user_online/user_offline deltas to the chat partners of users whose presence changed.
+    Changes are collected for `window` seconds and sent as one event per partner with the net result,
+    so a reconnect inside the window sends nothing and a reconnect storm costs one query per window.
+    """
+    def __init__(self, state, window=PRESENCE_WINDOW):
+        self.state = state
+        self.window = window
+        self.lock = threading.Lock()
+        # username -> whether the user was online before the first change in this window
+        self.pending = {}
+        self.running = False
+        self.app = None
+        self.socketio = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        if hasattr(self.state, 'heartbeat'): socketio.start_background_task(self.keep_alive)
+
+    def keep_alive(self):
+        """Heartbeats the shared state and sends user_offline for users of workers that died."""
+        while True:
+            try:
+                offline = self.state.heartbeat()
+            except Exception:
+                self.app.logger.exception('Presence heartbeat failed')
+                offline = []
+            for username in offline:
+                self.changed(username, online=False)
+            self.socketio.sleep(self.state.ttl / 3)
+
+    def changed(self, username, online):
+        with self.lock:
+            self.pending.setdefault(username, not online)
+            if self.running: return
+            self.running = True
+        self.socketio.start_background_task(self.run)
+
+    def run(self):
+        while True:
+            self.socketio.sleep(self.window)
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                if not pending:
+                    self.running = False
+                    return
+            try:
+                with self.app.app_context():
+                    self.flush(pending)
+            except Exception:
+                self.app.logger.exception('Presence flush failed')
+
+    def flush(self, pending):
+        online = self.state.online(pending)
+        changes = {username: username in online for username, was_online in pending.items() if (username in online) != was_online}
+        if not changes: return
+
+        events = defaultdict(lambda: {'user_online': [], 'user_offline': []})
+        for username, partners in chat_partners(changes).items():
+            event = 'user_online' if changes[username] else 'user_offline'
+            for partner in partners:
+                events[partner][event].append(username)
+
+        for partner in self.state.online(events):
+            for event, usernames in events[partner].items():
+                if usernames: self.socketio.emit(event, {'users': sorted(usernames)}, room=user_room(partner))
+
+    def snapshot(self, username):
+        """The user's chat partners that are online right now."""
+        return sorted(self.state.online(chat_partners([username])[username]))
+
+class TimerWheel:
+    """
+    Hashed timing wheel with a fixed delay: scheduling, rescheduling and cancelling are O(1) and
+    each tick only looks at its own slot. A rescheduled key stays behind in its old slot and is
+    skipped there because its deadline moved on.
+    """
+    def __init__(self, delay, tick):
+        self.delay = max(1, math.ceil(delay / tick))
+        self.slots = [set() for _ in range(self.delay + 1)]
+        self.deadlines = {}
+        self.now = 0
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key):
+        due = self.now + self.delay
+        self.deadlines[key] = due
+        self.slots[due % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def advance(self):
+        """Moves one tick forward and returns the keys that expired."""
+        self.now += 1
+        slot = self.slots[self.now % len(self.slots)]
+        expired = [key for key in slot if self.deadlines.get(key) == self.now]
+        slot.clear()
+        for key in expired:
+            del self.deadlines[key]
+        return expired
+
+class TypingIndicators:
+    """
+    Typing state per room on top of the shared state store. A keystroke from someone already typing
+    only pushes their expiry forward, typing_status is sent at most once per `interval` per room and
+    only when the room's typists changed, and a client that vanished without stop_typing drops out
+    after `ttl` seconds. The expiry itself lives in the state store, so it holds even when this worker
+    dies; the wheel only tells this worker when to send the resulting typing_status.
+    """
+    def __init__(self, state, interval=TYPING_INTERVAL, ttl=TYPING_TTL):
+        self.state = state
+        self.interval = interval
+        self.ttl = ttl
+        # one tick late rather than early, the store has to have expired the entry when the wheel fires
+        self.wheel = TimerWheel(ttl + interval, interval)
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.running = False
+        self.app = None
+        self.socketio = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+
+    def start(self, room, username):
+        changed = self.state.start_typing(room, username, self.ttl)
+        with self.lock:
+            self.wheel.schedule((room, username))
+            if changed: self.dirty.add(room)
+        self.wake()
+
+    def stop(self, room, username):
+        changed = self.state.stop_typing(room, username)
+        with self.lock:
+            self.wheel.cancel((room, username))
+            if changed: self.dirty.add(room)
+        if changed: self.wake()
+
+    def stop_everywhere(self, username):
+        rooms = self.state.stop_typing_everywhere(username)
+        with self.lock:
+            for room in rooms:
+                self.wheel.cancel((room, username))
+                self.dirty.add(room)
+        if rooms: self.wake()
+
+    def wake(self):
+        with self.lock:
+            if self.running: return
+            self.running = True
+        self.socketio.start_background_task(self.run)
+
+    def run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            with self.lock:
+                expired = self.wheel.advance()
+            try:
+                # still listed when another connection of the same user kept typing
+                stopped = {room for room, username in expired if username not in self.state.typing_users(room)}
+                with self.lock:
+                    dirty, self.dirty = self.dirty | stopped, set()
+                for room in dirty:
+                    self.socketio.emit('typing_status', {'room': room, 'users': self.state.typing_users(room)}, room=room)
+            except Exception:
+                self.app.logger.exception('Typing flush failed')
+            with self.lock:
+                if not self.wheel and not self.dirty:
+                    self.running = False
+                    return
+
+def advance_read_receipt(connection, client_generated_id, username):
+    """
+    Moves `username`'s watermark in the message's chat up to that message, with a single upsert that
+    resolves the message, the reader and their membership in SQL. Returns True when the watermark moved,
+    False when it already was there or past it, the message is unknown or the reader is not in the chat.
+    """
+    receipts = ChatReadReceipt.__table__
+    seen = select(ChatMessage.chat_id, User.id, ChatMessage.id).select_from(ChatMessage).join(
+        Chat, Chat.id == ChatMessage.chat_id
+    ).join(
+        User, or_(User.id == Chat.requester_user_id, User.id == Chat.seeker_user_id)
+    ).where(ChatMessage.client_generated_id == client_generated_id, User.username == username)
+
+    statement = upsert(connection, receipts).from_select(['chat_id', 'user_id', 'last_seen_message_id'], seen)
+    statement = statement.on_conflict_do_update(
+        index_elements=['chat_id', 'user_id'],
+        set_={'last_seen_message_id': statement.excluded.last_seen_message_id},
+        where=statement.excluded.last_seen_message_id > receipts.c.last_seen_message_id,
+    )
+    return connection.execute(statement).rowcount > 0
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages sent over the socket. A message is inserted with the rest of its
+    batch every `interval` seconds or as soon as `batch_size` messages are waiting. Once the batch committed
+    it is relayed to its room and the sender gets message_saved, a message from someone outside the chat
+    gets message_rejected and is never relayed. A client_generated_id that is already stored is skipped,
+    so resends are safe.
+    """
+    MAX_LENGTH = ChatMessage.message.type.length
+
+    def __init__(self, batch_size=MESSAGE_BATCH_SIZE, interval=MESSAGE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = OrderedDict()
+        self.inflight = {}
+        # read receipts for messages that are not stored yet, applied right after their batch commits
+        self.receipts = {}
+        self.running = False
+        self.app = None
+        self.socketio = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+
+    def add(self, sid, username, chat_id, room, message, client_generated_id):
+        """Queues a message and returns its row, or None when the same id is already waiting."""
+        with self.lock:
+            if client_generated_id in self.pending or client_generated_id in self.inflight: return None
+            row = self.pending[client_generated_id] = {
+                'sid': sid, 'username': username, 'chat_id': chat_id, 'room': room, 'message': message,
+                'client_generated_id': client_generated_id, 'timestamp': datetime.now(timezone.utc),
+            }
+            if len(self.pending) >= self.batch_size: self.wakeup.set()
+            if self.running: return row
+            self.running = True
+        self.socketio.start_background_task(self.run)
+        return row
+
+    def defer_read_receipt(self, client_generated_id, username):
+        """
+        Holds `username`'s read receipt for a message that is still queued until the message is stored.
+        Returns False when the message is not waiting here.
+        """
+        with self.lock:
+            if client_generated_id not in self.pending and client_generated_id not in self.inflight: return False
+            self.receipts.setdefault(client_generated_id, set()).add(username)
+            return True
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            with self.lock:
+                while self.pending and len(self.inflight) < self.batch_size:
+                    client_generated_id, row = self.pending.popitem(last=False)
+                    self.inflight[client_generated_id] = row
+                batch = list(self.inflight.values())
+                if not batch:
+                    self.running = False
+                    return
+            saved = []
+            try:
+                with self.app.app_context():
+                    saved = self.flush(batch)
+            except Exception:
+                self.app.logger.exception('Chat message flush failed')
+                for row in batch:
+                    self.socketio.emit('message_rejected', {'client_generated_id': row['client_generated_id']}, to=row['sid'])
+            # receipts taken together with the rows, later ones find the messages stored
+            with self.lock:
+                for row in batch:
+                    self.inflight.pop(row['client_generated_id'], None)
+                receipts = [(row, username) for row in saved for username in self.receipts.pop(row['client_generated_id'], ())]
+                for row in batch:
+                    self.receipts.pop(row['client_generated_id'], None)
+                if len(self.pending) >= self.batch_size: self.wakeup.set()
+            if receipts: self.apply_read_receipts(receipts)
+
+    def apply_read_receipts(self, receipts):
+        try:
+            with self.app.app_context():
+                moved = [(row, username) for row, username in receipts if advance_read_receipt(db.session.connection(), row['client_generated_id'], username)]
+                db.session.commit()
+        except Exception:
+            self.app.logger.exception('Read receipts failed')
+            return
+        for row, username in moved:
+            self.socketio.emit('chat_seen', {'room': row['room'], 'username': username, 'message_id': row['client_generated_id']}, room=row['room'])
+
+    def flush(self, batch):
+        # checked row by row, one malformed chat id must not fail the lookup for the whole batch
+        valid = [row for row in batch if type(row['chat_id']) is int and 0 < row['chat_id'] <= MAX_ID and isinstance(row['message'], str)]
+        usernames = {row['username'] for row in valid}
+        chat_ids = {row['chat_id'] for row in valid}
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)).all()) if valid else {}
+        chats = {chat_id: (room_name, (requester_id, seeker_id)) for chat_id, room_name, requester_id, seeker_id in db.session.query(
+            Chat.id, Chat.room_name, Chat.requester_user_id, Chat.seeker_user_id
+        ).filter(Chat.id.in_(chat_ids)).all()} if valid else {}
+
+        rows, saved = [], []
+        for row in valid:
+            room_name, participants = chats.get(row['chat_id'], (None, ()))
+            if user_ids.get(row['username']) not in participants or row['room'] != room_name or len(row['message']) > self.MAX_LENGTH: continue
+            saved.append(row)
+            rows.append({
+                'client_generated_id': row['client_generated_id'], 'sender_user_id': user_ids[row['username']], 'chat_id': row['chat_id'],
+                'message': row['message'], 'timestamp': row['timestamp'], 'seen': False,
+            })
+
+        if rows:
+            connection = db.session.connection()
+            statement = upsert(connection, ChatMessage.__table__).on_conflict_do_nothing(index_elements=['client_generated_id'])
+            connection.execute(statement, rows)
+            bump_after_commit(db.session, [chat_messages_key(row['chat_id']) for row in rows])
+            db.session.commit()
+
+        for row in saved:
+            self.socketio.send({
+                'client_generated_id': row['client_generated_id'], 'room_name': row['room'], 'message': row['message'],
+                'username': row['username'], 'timestamp': row['timestamp'].isoformat(),
+            }, to=row['room'])
+            self.socketio.emit('unseen_message', {'room': row['room']}, to=row['room'])
+            self.socketio.emit('message_saved', {'client_generated_id': row['client_generated_id'], 'chat_id': row['chat_id']}, to=row['sid'])
+        stored = {row['client_generated_id'] for row in saved}
+        for row in batch:
+            if row['client_generated_id'] not in stored: self.socketio.emit('message_rejected', {'client_generated_id': row['client_generated_id']}, to=row['sid'])
+        return saved
+
+def create_state(url=MESSAGE_QUEUE):
+    if url and url.startswith(('redis://', 'rediss://')):
+        import redis
+        return RedisState(redis.Redis.from_url(url))
+    return MemoryState()
+
+state = create_state()
+presence = PresenceBroadcaster(state)
+typing_indicators = TypingIndicators(state)
+message_writer = MessageWriter()
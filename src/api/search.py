@@ -0,0 +1,77 @@
+"""
+Full-text search over task titles and descriptions.
+PostgreSQL keeps a weighted tsvector column on task behind a GIN index, SQLite a FTS5 table
+keyed by task id. Both are maintained row by row from the Task mapper events, never by
+re-scanning the table.
+"""
+import re
+
+from sqlalchemy import event, inspect, text
+from api.models import Task, StatusEnum
+from api.utils import APIException
+
+# schema objects created by the search migration that are not part of the models
+SEARCH_TABLES = ('task_fts',)
+SEARCH_COLUMNS = ('search_vector',)
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+def index_tasks(connection, tasks):
+    rows = [{'id': task['id'], 'title': task['title'] or '', 'description': task['description'] or ''} for task in tasks]
+    if not rows: return
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "UPDATE task SET search_vector = setweight(to_tsvector('english', :title), 'A') || "
+            "setweight(to_tsvector('english', :description), 'B') WHERE id = :id"
+        ), rows)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM task_fts WHERE rowid = :id"), rows)
+        connection.execute(text("INSERT INTO task_fts (rowid, title, description) VALUES (:id, :title, :description)"), rows)
+
+def unindex_task(connection, task_id):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM task_fts WHERE rowid = :id"), {'id': task_id})
+
+@event.listens_for(Task, 'after_insert')
+def index_new_task(mapper, connection, task):
+    index_tasks(connection, [{'id': task.id, 'title': task.title, 'description': task.description}])
+
+@event.listens_for(Task, 'after_update')
+def reindex_task(mapper, connection, task):
+    state = inspect(task)
+    if state.attrs.title.history.has_changes() or state.attrs.description.history.has_changes():
+        index_tasks(connection, [{'id': task.id, 'title': task.title, 'description': task.description}])
+
+@event.listens_for(Task, 'after_delete')
+def unindex_deleted_task(mapper, connection, task):
+    unindex_task(connection, task.id)
+
+def search_task_ids(session, query, limit, offset=0):
+    """
+    Returns the ids of open tasks matching every term of `query` (prefix match), best match first.
+    """
+    terms = _terms(query)
+    if not terms: return []
+    params = {'status': StatusEnum.PENDING.name, 'limit': limit, 'offset': offset}
+    dialect = session.connection().dialect.name
+
+    if dialect == 'postgresql':
+        params['query'] = ' & '.join(term + ':*' for term in terms)
+        statement = text(
+            "SELECT task.id FROM task, to_tsquery('english', :query) AS query "
+            "WHERE task.search_vector @@ query AND task.status = :status "
+            "ORDER BY ts_rank(task.search_vector, query) DESC, task.id DESC LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == 'sqlite':
+        params['query'] = ' '.join('"%s"*' % term for term in terms)
+        statement = text(
+            "SELECT task.id FROM task_fts JOIN task ON task.id = task_fts.rowid "
+            "WHERE task_fts MATCH :query AND task.status = :status "
+            "ORDER BY bm25(task_fts, 2.0, 1.0), task.id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        raise APIException('Search is not supported on this database.', status_code=501)
+
+    return [row[0] for row in session.execute(statement, params)]
@@ -0,0 +1,256 @@
+"""
+Synthetic data for local load testing. Everything is drawn from one seeded random generator, so the same
+arguments produce the same dataset, and written with INSERTs in batches, reading back only the ids of rows
+that others refer to. Denormalized counters are left to reconcile_stats at the end, the way they would be
+repaired in production.
+"""
+import uuid
+from datetime import datetime, timedelta
+from random import Random
+
+from sqlalchemy import select, insert, func, case
+from api.models import db, upsert_addresses, RoleEnum, StatusEnum, User, Requester, TaskSeeker, Address, Category, Task, Postulant, Rating, Notification, Chat, ChatMessage, ChatReadReceipt
+from api.cache import bump_after_commit, notifications_key, chat_messages_key, TASKS, USERS
+from api.search import index_tasks
+from api.imports import insert_returning
+
+SEED_BATCH_SIZE = 5000
+# the dataset's clock, fixed so a seed reproduces the same timestamps
+EPOCH = datetime(2024, 1, 1)
+
+FIRST_NAMES = ['Lucia', 'Hugo', 'Martina', 'Mateo', 'Sofia', 'Leo', 'Julia', 'Daniel', 'Paula', 'Pablo', 'Valeria', 'Alvaro', 'Emma', 'Manuel', 'Carla', 'Javier']
+LAST_NAMES = ['Garcia', 'Rodriguez', 'Gonzalez', 'Fernandez', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez', 'Martin', 'Jimenez', 'Ruiz', 'Hernandez', 'Diaz']
+CITIES = [('Madrid', 40.4168, -3.7038), ('Barcelona', 41.3874, 2.1686), ('Valencia', 39.4699, -0.3763), ('Sevilla', 37.3891, -5.9845),
+          ('Zaragoza', 41.6488, -0.8891), ('Malaga', 36.7213, -4.4214), ('Bilbao', 43.2630, -2.9350)]
+STREETS = ['Calle Mayor', 'Gran Via', 'Calle de Alcala', 'Avenida de America', 'Paseo de Gracia', 'Calle Serrano', 'Calle del Sol',
+           'Avenida del Puerto', 'Calle Real', 'Plaza de Espana', 'Calle Nueva', 'Ronda de Valencia']
+CATEGORIES = ['Moving', 'Delivery', 'Assembly', 'Cleaning', 'Gardening', 'Shopping', 'Repairs']
+VERBS = ['Move', 'Deliver', 'Pick up', 'Assemble', 'Carry', 'Collect']
+ITEMS = ['a sofa', 'a washing machine', 'a bookshelf', 'the groceries', 'some boxes', 'a bicycle', 'a desk', 'a fridge', 'a mattress', 'documents', 'plants']
+DETAILS = ['before the weekend', 'to the third floor, no lift', 'across town', 'carefully, it is fragile', 'in the morning if possible', 'with a van']
+MESSAGES = ['Hi! Is this still available?', 'Yes, when can you come?', 'Tomorrow at 10 works for me.', 'Perfect, see you then.',
+            'I am on my way.', 'Can you send me the exact address?', 'Done, thanks a lot!', 'Is there parking nearby?']
+REVIEWS = [None, None, 'Great job, very punctual.', 'Friendly and careful.', 'Took longer than expected.', 'Would hire again.']
+NOTIFICATIONS = ['You have a new applicant for your task.', 'Your application was accepted.', 'Your task has been marked as completed.',
+                 'You have been rated for a task.', 'A task near you was just posted.']
+
+STATUS_WEIGHTS = {StatusEnum.PENDING: 40, StatusEnum.IN_PROGRESS: 20, StatusEnum.COMPLETED: 30, StatusEnum.CANCELLED: 10}
+ROLE_WEIGHTS = {RoleEnum.BOTH: 50, RoleEnum.REQUESTER: 25, RoleEnum.TASK_SEEKER: 25}
+STAR_WEIGHTS = [3, 4, 10, 33, 50]
+
+class Seeder:
+    def __init__(self, seed=42, batch_size=SEED_BATCH_SIZE, progress=None):
+        self.random = Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.counts = {}
+
+    def pick(self, weights):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def insert(self, model, rows):
+        """
+        Inserts `rows` and returns their ids in order.
+        """
+        if not rows: return []
+        table = model.__table__
+        inserted = insert_returning(db.session.connection(), table, rows, (table.c.id,))
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        # ids are drawn in VALUES order, sorting them restores it whatever order RETURNING used
+        return sorted(row['id'] for row in inserted)
+
+    def insert_many(self, model, rows):
+        """
+        Inserts `rows` with one executemany, for rows nothing else refers to.
+        """
+        if not rows: return
+        db.session.connection().execute(model.__table__.insert(), rows)
+        self.counts[model.__table__.name] = self.counts.get(model.__table__.name, 0) + len(rows)
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def point(self):
+        city, latitude, longitude = self.random.choice(CITIES)
+        return city, round(latitude + self.random.gauss(0, 0.04), 6), round(longitude + self.random.gauss(0, 0.05), 6)
+
+    def run(self, users, tasks, messages_per_chat=8, notifications_per_user=3):
+        """
+        Generates `users` users with their roles and home addresses, `tasks` tasks in every status with their
+        applicants, ratings, chats and messages, and a few notifications per user. Returns rows written per table.
+        """
+        # serials only number generated names, continuing past existing rows so a second run does not reuse them
+        self.address_serial = db.session.connection().execute(select(func.max(Address.__table__.c.id))).scalar() or 0
+        self.categories = [category_id for category_id, in db.session.query(Category.id).order_by(Category.id)]
+        if not self.categories:
+            self.categories = self.insert(Category, [{'name': name} for name in CATEGORIES])
+
+        self.requesters, self.seekers, self.addresses = [], [], []
+        self.seed_users(users)
+        self.seed_addresses(max(tasks // 2, 1))
+        self.seed_tasks(tasks, messages_per_chat)
+        self.seed_notifications(notifications_per_user)
+
+        bump_after_commit(db.session, [TASKS, USERS])
+        db.session.commit()
+        return self.counts
+
+    def new_addresses(self, count, user_ids=None):
+        rows = []
+        for index in range(count):
+            self.address_serial += 1
+            city, latitude, longitude = self.point()
+            street = STREETS[self.address_serial % len(STREETS)]
+            address = f'{street}, {self.address_serial // len(STREETS) + 1}, {city}'
+            rows.append({'address': address, 'latitude': latitude, 'longitude': longitude, 'user_id': user_ids[index] if user_ids else None})
+        ids = upsert_addresses(db.session.connection(), rows)
+        self.counts['address'] = self.counts.get('address', 0) + len(rows)
+        return [ids[row['address']] for row in rows]
+
+    def seed_users(self, total):
+        # numbers the generated usernames only, ids come back from the inserts
+        user_serial = db.session.connection().execute(select(func.max(User.__table__.c.id))).scalar() or 0
+        for start, count in self.batches(total):
+            rows, roles = [], []
+            for _ in range(count):
+                user_serial += 1
+                first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+                username = f'{first.lower()}{user_serial}'
+                role = self.pick(ROLE_WEIGHTS)
+                roles.append(role)
+                rows.append({'username': username, 'email': f'{username}@example.com', 'password': 'password', 'full_name': f'{first} {last}',
+                             'role': role, 'description': f'{first} from {self.random.choice(CITIES)[0]}.', 'unread_notifications': 0})
+            user_ids = self.insert(User, rows)
+
+            requester_users = [user_id for user_id, role in zip(user_ids, roles) if role in (RoleEnum.REQUESTER, RoleEnum.BOTH)]
+            seeker_users = [user_id for user_id, role in zip(user_ids, roles) if role in (RoleEnum.TASK_SEEKER, RoleEnum.BOTH)]
+            profile = {'overall_rating': 0, 'total_reviews': 0, 'archived': False}
+            requester_ids = self.insert(Requester, [dict(profile, user_id=user_id, total_requested_tasks=0, average_budget=0, total_open_tasks=0) for user_id in requester_users])
+            seeker_ids = self.insert(TaskSeeker, [dict(profile, user_id=user_id, total_completed_tasks=0, total_ongoing_tasks=0) for user_id in seeker_users])
+            self.requesters += zip(requester_ids, requester_users)
+            self.seekers += zip(seeker_ids, seeker_users)
+
+            self.new_addresses(len(user_ids), user_ids)
+            bump_after_commit(db.session, [TASKS, USERS])
+            db.session.commit()
+            self.progress(f'users: {start + count} of {total}')
+
+    def seed_addresses(self, total):
+        for start, count in self.batches(total):
+            self.addresses += self.new_addresses(count)
+            db.session.commit()
+        self.progress(f'addresses: {total}')
+
+    def seed_tasks(self, total, messages_per_chat):
+        if not self.requesters or not self.seekers: return
+        for start, count in self.batches(total):
+            rows, owners = [], []
+            for _ in range(count):
+                requester_id, requester_user = self.random.choice(self.requesters)
+                status = self.pick(STATUS_WEIGHTS)
+                seeker = None
+                if status in (StatusEnum.IN_PROGRESS, StatusEnum.COMPLETED) or (status == StatusEnum.CANCELLED and self.random.random() < 0.5):
+                    seeker = self.random.choice(self.seekers)
+                    if seeker[1] == requester_user: seeker = None if status == StatusEnum.CANCELLED else self.random.choice(self.seekers)
+                    if seeker and seeker[1] == requester_user: status, seeker = StatusEnum.PENDING, None
+                created = EPOCH + timedelta(minutes=self.random.randint(0, 365 * 24 * 60))
+                verb, item = self.random.choice(VERBS), self.random.choice(ITEMS)
+                rows.append({
+                    'title': f'{verb} {item}', 'description': f'Need someone to {verb.lower()} {item} {self.random.choice(DETAILS)}.',
+                    'creation_date': created, 'due_date': created + timedelta(days=self.random.randint(1, 30)), 'status': status,
+                    'budget': str(self.random.randint(2, 100) * 5), 'category_id': self.random.choice(self.categories),
+                    'delivery_location_id': self.random.choice(self.addresses), 'pickup_location_id': self.random.choice(self.addresses),
+                    'requester_id': requester_id, 'seeker_id': seeker[0] if seeker else None,
+                })
+                owners.append((requester_user, seeker))
+            task_ids = self.insert(Task, rows)
+            # core inserts skip the search hooks
+            index_tasks(db.session.connection(), [dict(row, id=task_id) for task_id, row in zip(task_ids, rows)])
+
+            tasks = list(zip(task_ids, rows, owners))
+            self.seed_applicants(tasks)
+            self.seed_ratings(tasks)
+            self.seed_chats(tasks, messages_per_chat)
+            bump_after_commit(db.session, [TASKS])
+            db.session.commit()
+            self.progress(f'tasks: {start + count} of {total}')
+
+    def seed_applicants(self, tasks):
+        rows = []
+        for task_id, task, (requester_user, seeker) in tasks:
+            applicants = {seeker} if seeker else set()
+            for _ in range(self.random.randint(0, 4)):
+                candidate = self.random.choice(self.seekers)
+                if candidate[1] != requester_user: applicants.add(candidate)
+            for applicant in sorted(applicants):
+                status = 'applied' if not task['seeker_id'] else 'accepted' if applicant == seeker else 'rejected'
+                rows.append({'task_id': task_id, 'seeker_id': applicant[0], 'status': status, 'price': str(int(task['budget']) + self.random.randint(-2, 4) * 5),
+                             'application_date': task['creation_date'] + timedelta(hours=self.random.randint(1, 48))})
+        self.insert_many(Postulant, rows)
+
+    def seed_ratings(self, tasks):
+        rows = []
+        for task_id, task, (requester_user, seeker) in tasks:
+            if task['status'] != StatusEnum.COMPLETED: continue
+            # the requester rates the seeker's work, the seeker rates the requester
+            if self.random.random() < 0.8:
+                rows.append({'task_id': task_id, 'seeker_id': seeker[1], 'requester_id': None, 'stars': self.random.choices(range(1, 6), STAR_WEIGHTS)[0], 'review': self.random.choice(REVIEWS)})
+            if self.random.random() < 0.6:
+                rows.append({'task_id': task_id, 'seeker_id': None, 'requester_id': requester_user, 'stars': self.random.choices(range(1, 6), STAR_WEIGHTS)[0], 'review': self.random.choice(REVIEWS)})
+        self.insert_many(Rating, rows)
+
+    def seed_chats(self, tasks, messages_per_chat):
+        chats = [(task_id, task, requester_user, seeker[1]) for task_id, task, (requester_user, seeker) in tasks if seeker]
+        chat_ids = self.insert(Chat, [{
+            'requester_user_id': requester_user, 'seeker_user_id': seeker_user, 'task_id': task_id,
+            'room_name': f'{requester_user}{seeker_user}{task_id}', 'archived': task['status'] in (StatusEnum.COMPLETED, StatusEnum.CANCELLED),
+        } for task_id, task, requester_user, seeker_user in chats])
+
+        rows = []
+        for chat_id, (task_id, task, requester_user, seeker_user) in zip(chat_ids, chats):
+            timestamp = task['creation_date'] + timedelta(hours=self.random.randint(1, 72))
+            count = self.random.randint(0, messages_per_chat * 2)
+            # the newest messages of live tasks are still unread
+            unseen = self.random.randint(0, 3) if task['status'] in (StatusEnum.PENDING, StatusEnum.IN_PROGRESS) else 0
+            for index in range(count):
+                timestamp += timedelta(minutes=self.random.randint(1, 240))
+                rows.append({'client_generated_id': self.uuid(), 'chat_id': chat_id, 'sender_user_id': (requester_user, seeker_user)[index % 2],
+                             'message': self.random.choice(MESSAGES), 'timestamp': timestamp, 'seen': index < count - unseen})
+        for start in range(0, len(rows), self.batch_size):
+            self.insert_many(ChatMessage, rows[start:start + self.batch_size])
+        self.seed_read_receipts(chat_ids)
+        bump_after_commit(db.session, [chat_messages_key(chat_id) for chat_id in chat_ids])
+
+    def seed_notifications(self, per_user):
+        user_ids = sorted({user_id for _, user_id in self.requesters} | {user_id for _, user_id in self.seekers})
+        rows = []
+        for user_id in user_ids:
+            for _ in range(self.random.randint(0, per_user * 2)):
+                rows.append({'user_id': user_id, 'message': self.random.choice(NOTIFICATIONS), 'seen': self.random.random() < 0.7,
+                             'creation_date': EPOCH + timedelta(minutes=self.random.randint(0, 365 * 24 * 60))})
+            if len(rows) >= self.batch_size:
+                self.write_notifications(rows)
+                rows = []
+        self.write_notifications(rows)
+        self.progress(f"notifications: {self.counts.get('notification', 0)}")
+
+    def write_notifications(self, rows):
+        self.insert_many(Notification, rows)
+        bump_after_commit(db.session, [notifications_key(user_id) for user_id in {row['user_id'] for row in rows}])
+        db.session.commit()
+
+    def seed_read_receipts(self, chat_ids):
+        """
+        Each reader of the chats in `chat_ids` has seen up to the newest message sent to them that is flagged seen.
+        """
+        if not chat_ids: return
+        messages, chats = ChatMessage.__table__, Chat.__table__
+        reader = case((messages.c.sender_user_id == chats.c.requester_user_id, chats.c.seeker_user_id), else_=chats.c.requester_user_id).label('user_id')
+        watermarks = select(messages.c.chat_id, reader, func.max(messages.c.id)).select_from(messages.join(chats, chats.c.id == messages.c.chat_id)) \
+            .where(messages.c.seen == True, messages.c.chat_id.in_(chat_ids)).group_by(messages.c.chat_id, reader)
+        result = db.session.connection().execute(insert(ChatReadReceipt.__table__).from_select(['chat_id', 'user_id', 'last_seen_message_id'], watermarks))
+        self.counts['chat_read_receipt'] = self.counts.get('chat_read_receipt', 0) + result.rowcount
@@ -1,4 +1,8 @@
-from flask import jsonify, url_for
+import base64
+import json
+import math
+
+from flask import jsonify, url_for, request
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +19,109 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Returns the id or offset a cursor from encode_cursor carries, anything else is a 400.
+    """
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise APIException('Invalid cursor.', status_code=400)
+    if type(value) is not int or value < 0: raise APIException('Invalid cursor.', status_code=400)
+    return value
+
+def is_paginated():
+    return 'after' in request.args or 'limit' in request.args
+
+def page_limit(default=20, maximum=100):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+def keyset_page(query, column, limit=None, after=None, key=None):
+    """
+    Returns one page of `query` ordered by `column` descending plus the cursor of the next page.
+    Seeks past the cursor instead of using OFFSET, so deep pages cost the same as the first one.
+    `key` reads the cursor value from a row when it is not the row's own `column` attribute.
+    """
+    limit = limit or page_limit()
+    after = after if after is not None else request.args.get('after')
+    key = key or (lambda row: getattr(row, column.key))
+    if after: query = query.filter(column < decode_cursor(after))
+    rows = query.order_by(column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+def geohash_encode(latitude, longitude, precision=12):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    bits, bit_count, even, geohash = 0, 0, True, []
+    while len(geohash) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+def _geohash_cell_size_km(precision, latitude):
+    lat_bits = (5 * precision) // 2
+    lng_bits = 5 * precision - lat_bits
+    height = 180.0 / 2 ** lat_bits * KM_PER_DEGREE
+    width = 360.0 / 2 ** lng_bits * KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+    return height, width
+
+def geohash_cells(latitude, longitude, radius_km):
+    """
+    Returns the geohash prefixes whose cells cover the bounding box of a circle.
+    Cells are picked at least as large as the radius, so the box never spans more than 3x3 of them.
+    """
+    precision = 1
+    for candidate in range(12, 0, -1):
+        if min(_geohash_cell_size_km(candidate, latitude)) >= radius_km:
+            precision = candidate
+            break
+
+    height, width = _geohash_cell_size_km(precision, latitude)
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    d_lat, d_lng = radius_km / KM_PER_DEGREE, radius_km / (KM_PER_DEGREE * cos_lat)
+    step_lat, step_lng = height / KM_PER_DEGREE, width / (KM_PER_DEGREE * cos_lat)
+
+    def samples(low, high, step):
+        points, point = [], low
+        while point < high:
+            points.append(point)
+            point += step
+        return points + [high]
+
+    cells = set()
+    for lat in samples(max(latitude - d_lat, -90.0), min(latitude + d_lat, 90.0), step_lat):
+        for lng in samples(longitude - d_lng, longitude + d_lng, step_lng):
+            cells.add(geohash_encode(lat, (lng + 180.0) % 360.0 - 180.0, precision))
+    return sorted(cells)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -10,11 +10,13 @@ from flask import Flask, request, jsonify, url_for, send_from_directory, render_
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from api.utils import APIException, generate_sitemap
-from api.models import db, Notification, User, Chat, Task, ChatMessage
+from api.models import db, User, Chat, Task
 from api.routes import api
 from api.admin import setup_admin
 from api.commands import setup_commands
-from flask_socketio import SocketIO, emit, send, join_room, leave_room
+from api.notifications import notification_service
+from api.realtime import socketio_options, user_room, advance_read_receipt, presence, typing_indicators, message_writer, state as realtime_state
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
@@ -29,10 +31,12 @@ app.url_map.strict_slashes = False
 app.config['JWT_SECRET_KEY'] = 'your_jwt_secret_key'  # Cambia esto a tu propia clave secreta
 jwt = JWTManager(app)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-usernames = {}
-typing_users = {}
+# SOCKETIO_MESSAGE_QUEUE lets several workers share rooms and presence, see api/realtime.py
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options())
+presence.init_app(app, socketio)
+typing_indicators.init_app(app, socketio)
+message_writer.init_app(app, socketio)
+notification_service.init_app(app, socketio)
 
 # database condiguration
 db_url = os.getenv("DATABASE_URL")
@@ -86,24 +90,34 @@ def serve_any_other_file(path):
 def handle_connect():
     username = request.args.get('username')
     if username:
-        usernames[request.sid] = username
-        emit('online_users', {'users': list(usernames.values())}, broadcast=True)
+        join_room(user_room(username))
+        if realtime_state.connect(request.sid, username): presence.changed(username, online=True)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    remove_user_from_typing()
-    if request.sid in usernames:
-        del usernames[request.sid]
-        emit('online_users', {'users': list(usernames.values())}, broadcast=True)
+    username, offline = realtime_state.disconnect(request.sid)
+    if username:
+        typing_indicators.stop_everywhere(username)
+        if offline: presence.changed(username, online=False)
+
+@socketio.on('presence_snapshot')
+def handle_presence_snapshot():
+    username = realtime_state.username(request.sid)
+    return {'users': presence.snapshot(username) if username else []}
 
 @socketio.on('message')
 def handle_message(data):
-    msg = data.get('message', 'No message provided')
-    user = data.get('username')
+    msg = data.get('message')
+    # sent as the socket's session user, a username in the payload is not trusted
+    user = realtime_state.username(request.sid)
     room = data.get('room')
+    chat_id = data.get('chat_id')
     unique_id = data.get('client_generated_id')
-    send({'client_generated_id': unique_id, 'room_name': room, 'message': msg, 'username': user}, room=room)
-    emit('unseen_message', {'room': room}, room=room)
+    # stored by the write-behind queue, which relays it to the room and acks the sender once its batch committed
+    if not (user and room and unique_id and msg and type(chat_id) is int):
+        emit('message_rejected', {'client_generated_id': unique_id})
+        return
+    message_writer.add(request.sid, user, chat_id, room, msg, unique_id)
 
 @socketio.on('join')
 def handle_join(data):
@@ -119,19 +133,16 @@ def handle_leave(data):
 def send_notification_to_room(room_name):
     data = request.json
     notification = data.get('notification')
-    send_notification(room_name, notification)
+    if not notification: return jsonify({ "error": "Missing notification." }), 400
 
+    # the room is the recipient's username
     existing_user = User.query.filter_by(username=room_name).first()
     if not existing_user: return jsonify({ "error": "User does not exist." }), 404
 
-    new_notification = Notification(user=existing_user, message=notification)
-    db.session.add(new_notification)
-    db.session.commit()
+    # stored and emitted by the notification worker
+    notification_service.notify(notification, user_ids=[existing_user.id])
     return "Notification sent to room: " + room_name
 
-def send_notification(room_name, notification):
-    emit('notification', {'message': notification}, room=room_name, namespace='/')
-
 
 @app.route('/chats', methods=['POST'])
 def create_chat():
@@ -168,49 +179,32 @@ def handle_new_chat(data):
     join_room(room_name)
     emit('new_chat', {'message': f"New chat room '{room_name}' created"}, room=room_name)
 
-@socketio.on('mark_message_as_seen')
-def handle_mark_message_as_seen(data):
-    message_id = data['message_id']
-    user_id = data['user_id']
-    chat_message = ChatMessage.query.filter_by(client_generated_id=message_id).first()
-    if chat_message and chat_message.sender_user_id != user_id and not chat_message.seen:
-        chat_message.seen = True
+@socketio.on('mark_chat_as_seen')
+def handle_mark_chat_as_seen(data):
+    message_id = data.get('message_id')
+    room = data.get('room')
+    username = realtime_state.username(request.sid)
+    if not message_id or not username: return
+    # one watermark per chat and reader, a message still in the write-behind queue gets it once stored
+    if message_writer.defer_read_receipt(message_id, username): return
+    if advance_read_receipt(db.session.connection(), message_id, username):
         db.session.commit()
-        emit('message_seen', {'message_id': message_id}, room=chat_message.chat.room_name)
+        emit('chat_seen', {'room': room, 'username': username, 'message_id': message_id}, room=room)
 
 @socketio.on('typing')
 def handle_typing(data):
-    user = data.get('username')
+    # only sockets that connected as a user can type, a username in the payload is not trusted
+    user = realtime_state.username(request.sid)
     room = data.get('room')
     if user and room:
-        if room not in typing_users:
-            typing_users[room] = []
-        if user not in typing_users[room]:
-            typing_users[room].append(user)
-        emit_typing_users(room)
+        typing_indicators.start(room, user)
 
 @socketio.on('stop_typing')
 def handle_stop_typing(data):
-    user = data.get('username')
+    user = realtime_state.username(request.sid)
     room = data.get('room')
-    if user and room and room in typing_users and user in typing_users[room]:
-        typing_users[room].remove(user)
-        if not typing_users[room]:
-            del typing_users[room]
-        emit_typing_users(room)
-
-def emit_typing_users(room):
-    emit('typing_status', {'room': room, 'users': typing_users.get(room, [])}, room=room, broadcast=True)
-
-def remove_user_from_typing():
-    rooms_to_remove = []
-    for room, users in typing_users.items():
-        if request.sid in users:
-            users.remove(request.sid)
-            if not users:
-                rooms_to_remove.append(room)
-    for room in rooms_to_remove:
-        del typing_users[room]
+    if user and room:
+        typing_indicators.stop(room, user)
 
 cloudinary.config(
     cloud_name = 'doojwu2m7',
@@ -30,16 +30,12 @@ export const BottomNavbar = () => {
 
         socket.on('new_chat', () => {
             actions.getChats();
-        });
-
-        socket.on('online_users', (data) => {
-            actions.setOnlineUsers(data.users);
+            socket.emit('presence_snapshot', (data) => actions.setOnlineUsers(data.users));
         });
 
         return () => {
             socket.off('unseen_message');
             socket.off('new_chat');
-            socket.off('online_users');
         };
     }, [socket, smallDevice]);
 
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import Message from './message.jsx';
 import { Context } from "../../store/appContext.js"
 import { Card, Form, Button, Spinner } from 'react-bootstrap';
@@ -12,17 +12,28 @@ const Chat = (props) => {
     const [message, setMessage] = useState('');
     const [loading, setLoading] = useState(true);
     const [typingUsers, setTypingUsers] = useState({});
+    const seenTimer = useRef(null);
+    const pendingMessages = useRef({});
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
+
+    // one page of history before `before` (the newest one without it), oldest message first
+    const fetchPage = async (before) => {
+        const response = await fetch(process.env.BACKEND_URL + `/api/chats/${props.chat.id}/messages?limit=50` + (before ? `&before=${before}` : ''));
+        const data = await response.json();
+        setOlderCursor(data.has_more ? data.before : null);
+        const page = data.messages.map((message) => ({ ...message, room_name: props.chat.room_name, sender_user: data.users[message.sender_user_id] }));
+        return page.sort((a, b) => {
+            const dateA = new Date(a.timestamp);
+            const dateB = new Date(b.timestamp);
+            return dateA - dateB;
+        });
+    };
 
     useEffect(() => {
         const fetchMessages = async () => {
             try {
-                const response = await fetch(process.env.BACKEND_URL + `/api/chats/${props.chat.id}/messages`);
-                const data = await response.json();
-                setMessages(data.slice().sort((a, b) => {
-                    const dateA = new Date(a.timestamp);
-                    const dateB = new Date(b.timestamp);
-                    return dateA - dateB;
-                }));
+                setMessages(await fetchPage());
                 setLoading(false);
                 scrollToBottom();
             } catch (error) {
@@ -40,6 +51,12 @@ const Chat = (props) => {
             scrollToBottom();
         });
 
+        socket.on('message_saved', ({ client_generated_id }) => {
+            delete pendingMessages.current[client_generated_id];
+        });
+
+        socket.on('message_rejected', ({ client_generated_id }) => resendMessage(client_generated_id));
+
         socket.on('typing_status', ({ room, users }) => {
             setTypingUsers((prevTypingUsers) => ({
                 ...prevTypingUsers,
@@ -50,6 +67,8 @@ const Chat = (props) => {
 
         return () => {
             socket.off('message');
+            socket.off('message_saved');
+            socket.off('message_rejected');
             socket.off('typing_status');
             handleStopTyping();
         };
@@ -60,30 +79,60 @@ const Chat = (props) => {
         chatContainer.scrollTop = chatContainer.scrollHeight;
     };
 
+    const loadOlderMessages = async () => {
+        const chatContainer = document.querySelector('.chat-content');
+        const scrollHeight = chatContainer.scrollHeight;
+        setLoadingOlder(true);
+        try {
+            const page = await fetchPage(olderCursor);
+            setMessages((prevMessages) => [...page, ...prevMessages]);
+            // keeps the message that was on top where it was
+            requestAnimationFrame(() => { chatContainer.scrollTop = chatContainer.scrollHeight - scrollHeight; });
+        } catch (error) {
+            console.error(error);
+        }
+        setLoadingOlder(false);
+    };
+
     const sendMessage = (e) => {
         e.preventDefault();
         if (message) {
             const uniqueId = actions.generateUniqueId(); 
-            socket.emit('message', { client_generated_id: uniqueId, username: store.user?.username, message, room: props.chat.room_name }); 
-            const config = {
-                method: "POST",
-                body: JSON.stringify({ client_generated_id: uniqueId, message, sender_id: store.user.id }),
-                headers: {
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json'
-                }
-            };
-
-            fetch(process.env.BACKEND_URL + `/api/chats/${props.chat.id}/messages`, config)
-            .catch(error => console.error(error));
+            const pending = { client_generated_id: uniqueId, username: store.user?.username, message, room: props.chat.room_name, chat_id: props.chat.id };
+            pendingMessages.current[uniqueId] = pending;
+            socket.emit('message', pending);
 
             handleStopTyping();
             setMessage('');
         }
     };
 
+    // the socket only relays messages it stored, a rejected one goes through the REST endpoint instead
+    const resendMessage = async (uniqueId) => {
+        const pending = pendingMessages.current[uniqueId];
+        if (!pending) return;
+        delete pendingMessages.current[uniqueId];
+        try {
+            const response = await fetch(process.env.BACKEND_URL + `/api/chats/${pending.chat_id}/messages`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ message: pending.message, sender_id: store.user?.id, client_generated_id: uniqueId }),
+            });
+            if (!response.ok) throw new Error((await response.json()).error);
+            setMessages((prevMessages) => [...prevMessages, { ...pending, room_name: pending.room, timestamp: new Date().toISOString() }]);
+            scrollToBottom();
+        } catch (error) {
+            console.error(error);
+            setMessage(pending.message);
+        }
+    };
+
     function markMessageAsSeen(message_id) {
-        if(message_id) socket.emit('mark_message_as_seen', { message_id: message_id, user_id: store.user.id });
+        // the server keeps one read watermark per chat, so only the newest message of a burst is reported
+        if(message_id) {
+            clearTimeout(seenTimer.current);
+            seenTimer.current = setTimeout(() => socket.emit('mark_chat_as_seen', { message_id: message_id, room: props.chat.room_name }), 300);
+        }
     }
 
     const handleTyping = () => {
@@ -105,15 +154,15 @@ const Chat = (props) => {
              <Card.Header className='d-flex justify-content-between align-items-center'>
                 <div className='d-flex flex-row align-items-center'>
                     <div className="rounded-circle bg-dark me-2 overflow-hidden" style={{ height: "40px", width: "40px", aspectRatio: "1/1" }}>
-                            {(props.chat.requester_user.id == store.user.id ? props.chat.seeker_user.profile_picture : props.chat.requester_user.profile_picture) && <img
+                            {props.chat.counterpart.profile_picture && <img
                             className="img-fluid"
-                            src={(props.chat.requester_user.id == store.user.id ? props.chat.seeker_user.profile_picture : props.chat.requester_user.profile_picture)}
+                            src={props.chat.counterpart.profile_picture}
                             alt="User Profile"
                             style={{ width: "100%", height: "100%", objectFit: "cover" }}
                         />}
                     </div>
                     <div className='d-flex flex-column justify-content-center'>
-                        <h5 className="mb-0">{props.chat.requester_user.id == store.user.id ? props.chat.seeker_user.username : props.chat.requester_user.username} for task {props.chat.task_id}</h5>
+                        <h5 className="mb-0">{props.chat.counterpart.username} for task {props.chat.task_title || props.chat.task_id}</h5>
                         <small>
                         {props.isUserOnline ? (
                                 ((typingUsers[props.chat.room_name]?.length > 0 && !typingUsers[props.chat.room_name]?.some((user) => user === store.user?.username))
@@ -140,15 +189,22 @@ const Chat = (props) => {
                     ? <div className="spinner-container">
                         <Spinner animation="border" variant="dark" />
                     </div>
-                    : (messages.map((msg, index) => (
+                    : (<>
+                    {olderCursor && (
+                        <Button onClick={loadOlderMessages} variant="link" size="sm" className="align-self-center" disabled={loadingOlder}>
+                            {loadingOlder ? 'Loading...' : 'Load older messages'}
+                        </Button>
+                    )}
+                    {messages.map((msg, index) => (
                     msg.room_name === props.chat.room_name && (
                         <Message
-                            key={index + 'msg'}
+                            key={(msg.client_generated_id || index) + 'msg'}
                             message={msg}
                             markMessageAsSeen={markMessageAsSeen}
                         />
                     )
-                )))}
+                ))}
+                </>)}
             </Card.Body>
             <Card.Footer>
                 <Form className="d-flex p-1" onSubmit={sendMessage}>
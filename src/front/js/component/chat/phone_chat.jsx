@@ -1,8 +1,8 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import { useNavigate, useParams } from 'react-router-dom'; 
 import Message from './message.jsx';
 import { Context } from "../../store/appContext.js"
-import { Form, Spinner } from 'react-bootstrap';
+import { Form, Button, Spinner } from 'react-bootstrap';
 import { useWebSocket } from '../../store/webSocketContext.js';
 import useScreenWidth from '../../hooks/useScreenWidth.jsx';
 import TypingAnimation from './typing_animation.jsx';
@@ -17,6 +17,10 @@ const PhoneChat = () => {
     const smallDevice = useScreenWidth();
     const navigate = useNavigate();
     const [typingUsers, setTypingUsers] = useState({});
+    const seenTimer = useRef(null);
+    const pendingMessages = useRef({});
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
 
     useEffect(() => {
         setLoading(true);
@@ -29,6 +33,12 @@ const PhoneChat = () => {
             scrollToBottom();
         });
         
+        socket.on('message_saved', ({ client_generated_id }) => {
+            delete pendingMessages.current[client_generated_id];
+        });
+
+        socket.on('message_rejected', ({ client_generated_id }) => resendMessage(client_generated_id));
+
         socket.on('typing_status', ({ room, users }) => {
             setTypingUsers((prevTypingUsers) => ({
                 ...prevTypingUsers,
@@ -38,6 +48,8 @@ const PhoneChat = () => {
 
         return () => {
             socket.off('message');
+            socket.off('message_saved');
+            socket.off('message_rejected');
             socket.off('typing_status');            
             handleStopTyping();
             actions.setUnseenMessages({ room: store.currentChat.room_name, hasUnseenMessages: false }, true);
@@ -54,46 +66,83 @@ const PhoneChat = () => {
         chatContainer.scrollTop = chatContainer.scrollHeight;
     };
 
+    // one page of history before `before` (the newest one without it), oldest message first
+    const fetchPage = async (before) => {
+        const response = await fetch(process.env.BACKEND_URL + `/api/chats/${chatid}/messages?limit=50` + (before ? `&before=${before}` : ''));
+        const data = await response.json();
+        setOlderCursor(data.has_more ? data.before : null);
+        const page = data.messages.map((message) => ({ ...message, room_name: store.currentChat?.room_name, sender_user: data.users[message.sender_user_id] }));
+        return page.sort((a, b) => {
+            const dateA = new Date(a.timestamp);
+            const dateB = new Date(b.timestamp);
+            return dateA - dateB;
+        });
+    };
+
     const fetchMessages = async () => {
         try {
-            const response = await fetch(process.env.BACKEND_URL + `/api/chats/${chatid}/messages`);
-            const data = await response.json();
-            setMessages(data.slice().sort((a, b) => {
-                const dateA = new Date(a.timestamp);
-                const dateB = new Date(b.timestamp);
-                return dateA - dateB;
-            }));
+            setMessages(await fetchPage());
             setLoading(false);
             scrollToBottom();
         } catch (error) {
             console.error(error);
         }
     };
+
+    const loadOlderMessages = async () => {
+        const chatContainer = document.querySelector('.chat-content');
+        const scrollHeight = chatContainer.scrollHeight;
+        setLoadingOlder(true);
+        try {
+            const page = await fetchPage(olderCursor);
+            setMessages((prevMessages) => [...page, ...prevMessages]);
+            // keeps the message that was on top where it was
+            requestAnimationFrame(() => { chatContainer.scrollTop = chatContainer.scrollHeight - scrollHeight; });
+        } catch (error) {
+            console.error(error);
+        }
+        setLoadingOlder(false);
+    };
     
     const sendMessage = (e) => {
         e.preventDefault();
         if (message) {
             const uniqueId = actions.generateUniqueId();
-            socket.emit('message', { client_generated_id: uniqueId, username: store.user?.username, message, room: store.currentChat?.room_name }); 
-            const config = {
-                method: "POST",
-                body: JSON.stringify({ client_generated_id: uniqueId, message, sender_id: store.user.id }),
-                headers: {
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json'
-                }
-            };
-
-            fetch(process.env.BACKEND_URL + `/api/chats/${store.currentChat?.id}/messages`, config)
-            .catch(error => console.error(error));
+            const pending = { client_generated_id: uniqueId, username: store.user?.username, message, room: store.currentChat?.room_name, chat_id: store.currentChat?.id };
+            pendingMessages.current[uniqueId] = pending;
+            socket.emit('message', pending);
 
             handleStopTyping();
             setMessage('');
         }
     };
 
+    // the socket only relays messages it stored, a rejected one goes through the REST endpoint instead
+    const resendMessage = async (uniqueId) => {
+        const pending = pendingMessages.current[uniqueId];
+        if (!pending) return;
+        delete pendingMessages.current[uniqueId];
+        try {
+            const response = await fetch(process.env.BACKEND_URL + `/api/chats/${pending.chat_id}/messages`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ message: pending.message, sender_id: store.user?.id, client_generated_id: uniqueId }),
+            });
+            if (!response.ok) throw new Error((await response.json()).error);
+            setMessages((prevMessages) => [...prevMessages, { ...pending, room_name: pending.room, timestamp: new Date().toISOString() }]);
+            scrollToBottom();
+        } catch (error) {
+            console.error(error);
+            setMessage(pending.message);
+        }
+    };
+
     function markMessageAsSeen(message_id) {
-        if(message_id) socket.emit('mark_message_as_seen', { message_id: message_id, user_id: store.user.id });
+        // the server keeps one read watermark per chat, so only the newest message of a burst is reported
+        if(message_id) {
+            clearTimeout(seenTimer.current);
+            seenTimer.current = setTimeout(() => socket.emit('mark_chat_as_seen', { message_id: message_id, room: store.currentChat?.room_name }), 300);
+        }
         if(store.currentChat?.room_name) actions.setUnseenMessages({ room: store.currentChat?.room_name, hasUnseenMessages: false }, true);
     }
 
@@ -117,15 +166,15 @@ const PhoneChat = () => {
             <div className="chat-header bg-light px-5 d-flex align-items-center">
                 <div className='d-flex flex-row align-items-center'>
                     <div className="rounded-circle bg-dark me-2 overflow-hidden" style={{ height: "40px", width: "40px", aspectRatio: "1/1" }}>
-                        {(store.currentChat?.requester_user.id == store.user.id ? store.currentChat?.seeker_user.profile_picture : store.currentChat?.requester_user.profile_picture) && <img
+                        {store.currentChat?.counterpart.profile_picture && <img
                         className="img-fluid"
-                        src={(store.currentChat?.requester_user.id == store.user.id ? store.currentChat?.seeker_user.profile_picture : store.currentChat?.requester_user.profile_picture)}
+                        src={store.currentChat?.counterpart.profile_picture}
                         alt="User Profile"
                         style={{ width: "100%", height: "100%", objectFit: "cover" }}
                     />}
                     </div>
                     <div className='d-flex flex-column justify-content-center'>
-                        <h5 className="mb-0">{store.currentChat.requester_user.id == store.user.id ? store.currentChat.seeker_user.username : store.currentChat.requester_user.username} for task {store.currentChat.task_id}</h5>
+                        <h5 className="mb-0">{store.currentChat.counterpart.username} for task {store.currentChat.task_title || store.currentChat.task_id}</h5>
                         <small>
                             {actions.isUserOnline(store.currentChat) ? (
                                 ((typingUsers[store.currentChat.room_name]?.length > 0 && !typingUsers[store.currentChat.room_name]?.some((user) => user === store.user?.username))
@@ -150,14 +199,21 @@ const PhoneChat = () => {
                     ? (<div className="spinner-container">
                             <Spinner animation="border" variant="dark" />
                         </div>
-                    ) : (messages.map((msg, index) => (
+                    ) : (<>
+                        {olderCursor && (
+                            <Button onClick={loadOlderMessages} variant="link" size="sm" className="align-self-center" disabled={loadingOlder}>
+                                {loadingOlder ? 'Loading...' : 'Load older messages'}
+                            </Button>
+                        )}
+                        {messages.map((msg, index) => (
                         msg.room_name === store.currentChat?.room_name && ( 
                             <Message
-                                key={index + 'msgp'}
+                                key={(msg.client_generated_id || index) + 'msgp'}
                                 message={msg}
                                 markMessageAsSeen={markMessageAsSeen}
                             />
-                    ))))}
+                    ))) }
+                    </>)}
             </div>
 
             <div className="p-2 bg-light">
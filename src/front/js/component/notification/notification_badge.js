@@ -23,9 +23,9 @@ const Notification = () => {
 
     return (
         <div>
-            {store.notifications.length > 0 && (
+            {store.unreadNotifications > 0 && (
                 <span className="position-absolute top-0 end-0 badge rounded-pill bg-danger" style={{ fontSize: "0.6rem" }}>
-                    {store.notifications.length}
+                    {store.unreadNotifications}
                 </span>
             )}
         </div>
@@ -21,19 +21,10 @@ const NotificationDropdown = ({ dropdownVisible, setDropdownVisible }) => {
     }, []);
 
     useEffect(() => {
-        if(store.notifications.length > 0) markAsSeen();
+        if(store.notifications.length > 0) actions.markNotificationsAsSeen();
         if(!dropdownVisible) actions.emptyNotifications();
     }, [dropdownVisible]);
 
-    function markAsSeen() {
-        for(let notification of store.notifications) {
-            if(notification.id) {
-                fetch(process.env.BACKEND_URL+ `/api/notifications/${notification.id}`, { method: 'PUT' })
-                .catch(error => console.error(error))
-            }
-        }
-    }
-
     return (
         <div ref={ref} className={`dropdown-menu ${dropdownVisible ? 'show' : ''}`} style={{ zIndex: 1, maxHeight: '60vh' }}>
             { store.notifications.map((notification, index) => {
@@ -16,14 +16,14 @@ const PhoneChatList = () => {
                         ) : ( store.chats?.map((chat) => (
                             <div key={chat.id} className="d-flex p-2 border-bottom chat-item rounded align-items-center" onClick={() => {navigate(`/chats/${chat.id}`); actions.setCurrentChat(chat); }}>
                                 <div className="rounded-circle bg-dark me-2 overflow-hidden" style={{ height: "40px", width: "40px", aspectRatio: "1/1" }}>
-                                    {(chat.requester_user.id == store.user.id ? chat.seeker_user.profile_picture : chat.requester_user.profile_picture) && <img
+                                    {chat.counterpart.profile_picture && <img
                                     className="img-fluid"
-                                    src={(chat.requester_user.id == store.user.id ? chat.seeker_user.profile_picture : chat.requester_user.profile_picture)}
+                                    src={chat.counterpart.profile_picture}
                                     alt="User Profile"
                                     style={{ width: "100%", height: "100%", objectFit: "cover" }}
                                 />}
                                 </div>
-                            <div>{chat.requester_user.id == store.user.id ? chat.seeker_user.username : chat.requester_user.username} for task {chat.task_id}</div>
+                            <div>{chat.counterpart.username} for task {chat.task_title || chat.task_id}</div>
                                 {actions.isUserOnline(chat) && (
                                 <span className="text-success ms-2">&#9679;</span>
                             )}
@@ -33,6 +33,7 @@ const getState = ({ getStore, getActions, setStore }) => {
 			access_token: "",
 			valid_token: false,
 			notifications: [],
+			unreadNotifications: 0,
 			chats: [],
 			login_error: '',
 			access_token: localStorage.getItem('access_token') || "",
@@ -48,10 +49,12 @@ const getState = ({ getStore, getActions, setStore }) => {
 			setError: (error) => { setStore({ message: "", error: error }) },
 			setCurrentChat: (chat) => { setStore({ currentChat: chat }) },
 			setOnlineUsers: (onlineUsers) => { setStore({ onlineUsers: onlineUsers }) },
+			addOnlineUsers: (usernames) => { setStore({ onlineUsers: [...new Set([...getStore().onlineUsers, ...usernames])] }) },
+			removeOnlineUsers: (usernames) => { setStore({ onlineUsers: getStore().onlineUsers.filter(username => !usernames.includes(username)) }) },
 			emptyNotifications: () => { setStore ({ notifications: [] })},
 			setFromApplicants: (bool) => { setStore({ fromApplicants: bool })},
 			isUserOnline: (chat) => {
-				const otherUser = chat.requester_user.id === getStore().user.id ? chat.seeker_user.username : chat.requester_user.username;
+				const otherUser = chat.counterpart.username;
 				return getStore().onlineUsers.includes(otherUser);
 			},
 
@@ -94,10 +97,14 @@ const getState = ({ getStore, getActions, setStore }) => {
 
 			fetchChatsAndUnseenMessages: async () => {
 				await getActions().getChats();
+				if (!getStore().user.id) return;
 				const unseenMessagesStatus = {};
-				for (const chat of getStore().chats) {
-					const hasUnseenMessages = await getActions().checkUnseenMessages(getStore().user.id, chat.id);
-					unseenMessagesStatus[chat.room_name] = hasUnseenMessages;
+				try {
+					const res = await fetch(`${process.env.BACKEND_URL}/api/users/${getStore().user.id}/chats/summary`);
+					const summary = await res.json();
+					for (const chat of summary) unseenMessagesStatus[chat.room_name] = chat.has_unseen_messages;
+				} catch (error) {
+					console.error("Error checking unseen messages:", error);
 				}
 				getActions().setUnseenMessages(unseenMessagesStatus);
 			},
@@ -832,9 +839,19 @@ const getState = ({ getStore, getActions, setStore }) => {
 
 			getNotifications: () => {
 				fetchHelper(
-					process.env.BACKEND_URL + `/api/users/${getStore().user.id}/unseen-notifications`,
+					process.env.BACKEND_URL + `/api/users/${getStore().user.id}/notifications?limit=20`,
 					{},
-					(data) => setStore({ notifications: data })
+					(data) => setStore({ notifications: data.notifications.filter(notification => !notification.seen), unreadNotifications: data.unread_count })
+				);
+			},
+
+			markNotificationsAsSeen: () => {
+				const ids = getStore().notifications.map(notification => notification.id).filter(id => id);
+				if (ids.length == 0) return;
+				fetchHelper(
+					process.env.BACKEND_URL + `/api/users/${getStore().user.id}/notifications/seen?up_to=${Math.max(...ids)}`,
+					{ method: 'PUT' },
+					(data) => setStore({ unreadNotifications: Math.max(0, getStore().unreadNotifications - data.marked) })
 				);
 			},
 
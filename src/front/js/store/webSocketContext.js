@@ -6,20 +6,27 @@ const WebSocketContext = createContext(null);
 
 export const WebSocketProvider = ({ children }) => {
     const [socket, setSocket] = useState(null);
-    const { store } = useContext(Context);
+    const { store, actions } = useContext(Context);
 
     useEffect(() => {
         let newSocket = null;
         if (store.user?.username) {
             newSocket = io(process.env.BACKEND_URL, {
-                query: { username: store.user?.username }
+                query: { username: store.user?.username },
+                // no long-polling: a websocket stays on one worker, so no sticky sessions are needed
+                transports: ['websocket']
             });
             setSocket(newSocket);
 
             newSocket.on('connect', () => {
                 console.log('Connected to server');
+                // full list once per (re)connection, deltas after that
+                newSocket.emit('presence_snapshot', (data) => actions.setOnlineUsers(data.users));
             });
 
+            newSocket.on('user_online', (data) => actions.addOnlineUsers(data.users));
+            newSocket.on('user_offline', (data) => actions.removeOnlineUsers(data.users));
+
             newSocket.on('disconnect', () => {
                 console.log('Disconnected from server');
             });